@@ -1,9 +1,13 @@
 from .antispam import AntiSpam
 
-__red_end_user_data_statement__ = "This cog does not persistently store data about users."
+__red_end_user_data_statement__ = (
+    "This cog temporarily stores the user IDs of those rate limited or blacklisted from using commands, until their limit or blacklist expires.\n"
+    "This cog supports data removal requests."
+)
 
 
 async def setup(bot):
     cog = AntiSpam(bot)
     await cog.gen_cache()
+    await cog.load_state()
     bot.add_cog(cog)
@@ -1,18 +1,33 @@
+import asyncio
+import heapq
 import logging
+import time
 from datetime import datetime, timedelta
+from io import BytesIO
 
 import discord
 from redbot.core import Config, commands
 from redbot.core.commands.converter import TimedeltaConverter
 from redbot.core.utils.chat_formatting import humanize_timedelta, pagify
 
+from .limiter import RateLimiter
+from .messages import GuildScorer
+
 log = logging.getLogger("red.flare.antispam")
 
+# Names of the core set subcommands which change a guild's mod or admin roles. They
+# moved under `set roles` in Red 3.5, so only the command's own name is compared.
+ROLE_COMMANDS = {"addadminrole", "removeadminrole", "addmodrole", "removemodrole"}
+# Seconds a guild's mod and admin roles are cached, in case they change another way.
+BYPASS_ROLES_TTL = 300
+# Seconds between snapshots of the blacklist and rate limiter state.
+SNAPSHOT_INTERVAL = 60
+
 
 class AntiSpam(commands.Cog):
     """Blacklist those who spam commands."""
 
-    __version__ = "0.0.7"
+    __version__ = "0.2.0"
     __author__ = "flare#0001"
 
     def format_help_for_context(self, ctx):
@@ -24,70 +39,283 @@ class AntiSpam(commands.Cog):
         self.bot = bot
         self.config = Config.get_conf(self, identifier=95932766180343808, force_registration=True)
         self.config.register_global(
-            mute_length=300, amount=5, per=5, mod_bypass=True, logging=None
+            mute_length=300,
+            amount=5,
+            per=5,
+            mod_bypass=True,
+            logging=None,
+            limits={"command": {}, "cog": {}},
+            state={"blacklist": [], "limiter": []},
+        )
+        self.config.register_guild(
+            amount=None, per=None, message_spam=False, message_threshold=10, message_delete=False
         )
-        self.cache = {}
+        self.limiter = RateLimiter()
+        self.guild_limits = {}
+        self.bypass_roles = {}
+        self.message_guilds = {}
+        self.scorers = {}
         self.blacklist = {}
+        self.expiries = []
+        self.wakeup = asyncio.Event()
+        self.saved_state = None
+        self.save_lock = asyncio.Lock()
+        self.sweeper = bot.loop.create_task(self.sweep_loop())
+        self.snapshotter = bot.loop.create_task(self.snapshot_loop())
         bot.add_check(self.check)
 
+    def cog_unload(self):
+        self.sweeper.cancel()
+        self.snapshotter.cancel()
+        self.bot.remove_check(self.check)
+
     async def red_get_data_for_user(self, *, user_id: int):
-        # this cog does not story any data
-        return {}
+        entry = self.blacklist.get(user_id)
+        if entry is None:
+            return {}
+        contents = f"Discord user with ID {user_id} is blacklisted from using commands until {entry['expiry']}.\n"
+        return {"user_data.txt": BytesIO(contents.encode())}
 
     async def red_delete_data_for_user(self, *, requester, user_id: int) -> None:
-        # this cog does not story any data
-        pass
+        self.blacklist.pop(user_id, None)
+        self.limiter.discard(
+            lambda key: key == user_id or isinstance(key, tuple) and key[-1] == user_id
+        )
+        await self.save_state()
+
+    def snapshot(self) -> dict:
+        """Compact, JSON serialisable copy of the blacklist and limiter state.
+
+        Expired entries are pruned first so they are never written.
+        """
+        now = datetime.now()
+        return {
+            "blacklist": [
+                [user_id, entry["expiry"].timestamp()]
+                for user_id, entry in self.blacklist.items()
+                if entry["expiry"] > now
+            ],
+            "limiter": self.limiter.snapshot(),
+        }
+
+    async def save_state(self):
+        """Write a snapshot if the state changed, saves run one at a time and in order."""
+        async with self.save_lock:
+            state = self.snapshot()
+            if state == self.saved_state:
+                return
+            try:
+                await self.config.state.set(state)
+            except Exception:
+                log.exception("Failed to save the antispam state.")
+                return
+            self.saved_state = state
+
+    async def load_state(self):
+        state = await self.config.state()
+        now = datetime.now()
+        for user_id, expiry in state["blacklist"]:
+            expiry = datetime.fromtimestamp(expiry)
+            if expiry > now:
+                self.add_blacklist(user_id, expiry, save=False)
+        self.limiter.restore(state["limiter"])
+        self.saved_state = state
+
+    async def snapshot_loop(self):
+        while True:
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
+            await self.save_state()
 
     async def gen_cache(self):
         self.config_cache = await self.config.all()
+        all_guilds = await self.config.all_guilds()
+        self.guild_limits = {guild: data for guild, data in all_guilds.items() if data["amount"]}
+        self.message_guilds = {
+            guild: data for guild, data in all_guilds.items() if data["message_spam"]
+        }
+        for guild in set(self.scorers) - set(self.message_guilds):
+            del self.scorers[guild]
 
-    def check(self, ctx):
-        user = self.blacklist.get(ctx.author.id)
-        if user is None:
-            return True
-        if self.blacklist[ctx.author.id]["expiry"] < datetime.now():
-            del self.blacklist[ctx.author.id]
-            log.debug(f"{ctx.author}({ctx.author.id}) has been removed from the spam blacklist.")
-            return True
-        if isinstance(ctx.command, commands.commands._AlwaysAvailableCommand):
+    def get_limits(self, ctx):
+        """Yield the (key, amount, per) of every limit that applies to a command.
+
+        A guild limit replaces the global one, while cog and command limits are checked
+        on top of it with their own windows.
+        """
+        guild_limit = self.guild_limits.get(ctx.guild.id) if ctx.guild else None
+        if guild_limit:
+            yield (ctx.guild.id, ctx.author.id), guild_limit["amount"], guild_limit["per"]
+        else:
+            yield ctx.author.id, self.config_cache["amount"], self.config_cache["per"]
+        limits = self.config_cache["limits"]
+        cog = ctx.command.cog_name
+        if cog in limits["cog"]:
+            limit = limits["cog"][cog]
+            yield ("cog", cog, ctx.author.id), limit["amount"], limit["per"]
+        command = ctx.command.qualified_name
+        if command in limits["command"]:
+            limit = limits["command"][command]
+            yield ("command", command, ctx.author.id), limit["amount"], limit["per"]
+
+    async def get_bypass_roles(self, guild: discord.Guild) -> frozenset:
+        """Mod and admin role IDs of a guild.
+
+        Cached until they are changed through the core commands, a role is deleted, or
+        ``BYPASS_ROLES_TTL`` seconds pass.
+        """
+        now = time.monotonic()
+        cached = self.bypass_roles.get(guild.id)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        roles = frozenset(
+            (
+                *await self.bot.get_admin_role_ids(guild.id),
+                *await self.bot.get_mod_role_ids(guild.id),
+            )
+        )
+        self.bypass_roles[guild.id] = (now + BYPASS_ROLES_TTL, roles)
+        return roles
+
+    async def bypasses(self, author) -> bool:
+        if author.id in self.bot.owner_ids:
             return True
-        return False
+        if not self.config_cache["mod_bypass"] or not isinstance(author, discord.Member):
+            return False
+        roles = await self.get_bypass_roles(author.guild)
+        return any(role.id in roles for role in author.roles)
+
+    def check(self, ctx):
+        return ctx.author.id not in self.blacklist or isinstance(
+            ctx.command, commands.commands._AlwaysAvailableCommand
+        )
+
+    def add_blacklist(self, user_id: int, expiry: datetime, *, save: bool = True):
+        """Blacklist a user until ``expiry``.
+
+        Blacklisting is rare, so the state is saved straight away rather than on the next
+        snapshot, and a reload or restart can't free the user.
+        """
+        self.blacklist[user_id] = {"id": user_id, "expiry": expiry}
+        heapq.heappush(self.expiries, (expiry, user_id))
+        if self.expiries[0][1] == user_id:
+            self.wakeup.set()
+        if save:
+            self.bot.loop.create_task(self.save_state())
+
+    async def sweep_loop(self):
+        """Remove users from the blacklist as their entries expire.
+
+        Sleeps until the earliest expiry in the heap, or until a user is blacklisted
+        with an earlier one. Heap entries for users who were removed or blacklisted
+        again are skipped.
+        """
+        while True:
+            try:
+                self.wakeup.clear()
+                now = datetime.now()
+                while self.expiries and self.expiries[0][0] <= now:
+                    expiry, user_id = heapq.heappop(self.expiries)
+                    entry = self.blacklist.get(user_id)
+                    if entry is not None and entry["expiry"] == expiry:
+                        del self.blacklist[user_id]
+                        await self.unblacklisted(user_id)
+                timeout = (self.expiries[0][0] - now).total_seconds() if self.expiries else None
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except Exception as exc:
+                log.error("Exception in sweep_loop: ", exc_info=exc)
+
+    async def unblacklisted(self, user_id: int):
+        user = self.bot.get_user(user_id)
+        log.debug(f"{user}({user_id}) has been removed from the spam blacklist.")
+        if self.config_cache.get("logging", None) is not None:
+            channel = self.bot.get_channel(self.config_cache["logging"])
+            if channel:
+                try:
+                    await channel.send(
+                        f"{user}({user_id}) is no longer blacklisted from using commands."
+                    )
+                except discord.HTTPException:
+                    pass
 
     @commands.Cog.listener()
     async def on_command(self, ctx):
-        if await self.bot.is_owner(ctx.author) or (
-            self.config_cache["mod_bypass"] and await self.bot.is_mod(ctx.author)
-        ):
+        if await self.bypasses(ctx.author):
             return
         author = ctx.author
-        ctx.guild
-        now = datetime.now()
-        if author.id not in self.cache:
-            self.cache[author.id] = {"count": 1, "time": now}
-        else:
-            if now - self.cache[author.id]["time"] > timedelta(seconds=self.config_cache["per"]):
-                self.cache[author.id] = {"count": 1, "time": now}
-                return
-            self.cache[author.id]["count"] += 1
-            if (
-                self.cache[author.id]["count"] >= self.config_cache["amount"]
-                and author.id not in self.blacklist
-            ):
-                log.debug(
-                    f"{ctx.author}({ctx.author.id}) has been blacklisted from using commands for {self.config_cache['mute_length']} seconds."
-                )
-                expiry = datetime.now() + timedelta(seconds=self.config_cache["mute_length"])
-                self.blacklist[author.id] = {"id": author.id, "expiry": expiry}
-                await ctx.send(
-                    f"Slow down {ctx.author.name}! You're now on a {humanize_timedelta(seconds=self.config_cache['mute_length'])} cooldown from commands.",
-                    delete_after=self.config_cache["mute_length"],
+        if ctx.command is None:
+            return
+        triggered = [
+            self.limiter.hit(key, amount, per) for key, amount, per in self.get_limits(ctx)
+        ]
+        if any(triggered) and author.id not in self.blacklist:
+            log.debug(
+                f"{ctx.author}({ctx.author.id}) has been blacklisted from using commands for {self.config_cache['mute_length']} seconds."
+            )
+            expiry = datetime.now() + timedelta(seconds=self.config_cache["mute_length"])
+            self.add_blacklist(author.id, expiry)
+            await ctx.send(
+                f"Slow down {ctx.author.name}! You're now on a {humanize_timedelta(seconds=self.config_cache['mute_length'])} cooldown from commands.",
+                delete_after=self.config_cache["mute_length"],
+            )
+            if self.config_cache.get("logging", None) is not None:
+                channel = self.bot.get_channel(self.config_cache["logging"])
+                if channel:
+                    await channel.send(
+                        f"{ctx.author}({ctx.author.id}) has been blacklisted from using commands for {self.config_cache['mute_length']} seconds."
+                    )
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        if message.guild is None or message.author.bot:
+            return
+        settings = self.message_guilds.get(message.guild.id)
+        if settings is None:
+            return
+        scorer = self.scorers.get(message.guild.id)
+        if scorer is None:
+            scorer = self.scorers[message.guild.id] = GuildScorer()
+        score, reasons = scorer.score(message)
+        if score < settings["message_threshold"] or await self.bypasses(message.author):
+            return
+        if settings["message_delete"]:
+            try:
+                await message.delete()
+            except discord.HTTPException:
+                pass
+        if not scorer.flag(message.author.id):
+            return
+        log.debug(
+            f"{message.author}({message.author.id}) flagged for spam in {message.guild}({message.guild.id}) with a score of {score}: {', '.join(reasons)}."
+        )
+        if self.config_cache.get("logging", None) is not None:
+            channel = self.bot.get_channel(self.config_cache["logging"])
+            if channel:
+                await channel.send(
+                    f"{message.author}({message.author.id}) has been flagged for spam in {message.channel.mention} of {message.guild}: {', '.join(reasons)}."
                 )
-                if self.config_cache.get("logging", None) is not None:
-                    channel = self.bot.get_channel(self.config_cache["logging"])
-                    if channel:
-                        await channel.send(
-                            f"{ctx.author}({ctx.author.id}) has been blacklisted from using commands for {self.config_cache['mute_length']} seconds."
-                        )
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.bypass_roles.pop(guild.id, None)
+        self.scorers.pop(guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_command_completion(self, ctx):
+        command = ctx.command
+        if (
+            ctx.guild is not None
+            and command.name in ROLE_COMMANDS
+            and command.root_parent is not None
+            and command.root_parent.name == "set"
+        ):
+            self.bypass_roles.pop(ctx.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        self.bypass_roles.pop(role.guild.id, None)
 
     @commands.is_owner()
     @commands.group()
@@ -147,6 +375,109 @@ class AntiSpam(commands.Cog):
             await ctx.send("Logging will no longer be posted.")
         await self.gen_cache()
 
+    @antispamset.command(name="command")
+    async def _command(
+        self, ctx, command: str, amount: int = None, *, per: TimedeltaConverter = None
+    ):
+        """Set a separate limit for a command.
+
+        Commands with spaces in their name must be quoted. The timeframe defaults to the
+        global one. Leave out the amount to remove the command's limit.
+        """
+        cmd = self.bot.get_command(command)
+        if cmd is None:
+            return await ctx.send(f"`{command}` isn't a command.")
+        await self.set_limit(ctx, "command", cmd.qualified_name, amount, per)
+
+    @antispamset.command()
+    async def cog(self, ctx, cog: str, amount: int = None, *, per: TimedeltaConverter = None):
+        """Set a separate limit for all commands of a cog.
+
+        The timeframe defaults to the global one. Leave out the amount to remove the cog's
+        limit.
+        """
+        cog_obj = self.bot.get_cog(cog)
+        if cog_obj is None:
+            return await ctx.send(f"`{cog}` isn't a loaded cog.")
+        await self.set_limit(ctx, "cog", cog_obj.qualified_name, amount, per)
+
+    async def set_limit(self, ctx, scope: str, name: str, amount, per):
+        if amount is None:
+            async with self.config.limits() as limits:
+                limits[scope].pop(name, None)
+            await ctx.send(f"The {scope} `{name}` will now only use the global limit.")
+            return await self.gen_cache()
+        if amount < 1:
+            return await ctx.send("You must provide a value greater than 0.")
+        duration_seconds = per.total_seconds() if per else self.config_cache["per"]
+        async with self.config.limits() as limits:
+            limits[scope][name] = {"amount": amount, "per": duration_seconds}
+        await ctx.send(
+            f"The spam filter will now check for {amount} uses of the {scope} `{name}` during a {humanize_timedelta(seconds=duration_seconds)} period."
+        )
+        await self.gen_cache()
+
+    @commands.guild_only()
+    @antispamset.command()
+    async def guild(self, ctx, amount: int = None, *, per: TimedeltaConverter = None):
+        """Set a limit for this server which replaces the global one.
+
+        The timeframe defaults to the global one. Leave out the amount to use the global
+        limit again.
+        """
+        if amount is None:
+            await self.config.guild(ctx.guild).amount.clear()
+            await self.config.guild(ctx.guild).per.clear()
+            await ctx.send("This server will now use the global limit.")
+            return await self.gen_cache()
+        if amount < 1:
+            return await ctx.send("You must provide a value greater than 0.")
+        duration_seconds = per.total_seconds() if per else self.config_cache["per"]
+        await self.config.guild(ctx.guild).amount.set(amount)
+        await self.config.guild(ctx.guild).per.set(duration_seconds)
+        await ctx.send(
+            f"The spam filter will now check for {amount} commands during a {humanize_timedelta(seconds=duration_seconds)} period in this server."
+        )
+        await self.gen_cache()
+
+    @commands.guild_only()
+    @antispamset.group()
+    async def messages(self, ctx):
+        """Settings for scoring messages in this server for spam.
+
+        Messages score points for near duplicates of the author's recent messages, both in
+        the same and in other channels, and for bursts of mentions or attachments.
+        """
+
+    @messages.command(name="toggle")
+    async def messages_toggle(self, ctx, on_or_off: bool):
+        """Toggle whether messages in this server are checked for spam."""
+        await self.config.guild(ctx.guild).message_spam.set(on_or_off)
+        if on_or_off:
+            await ctx.send("Messages in this server will now be checked for spam.")
+        else:
+            await ctx.send("Messages in this server will no longer be checked for spam.")
+        await self.gen_cache()
+
+    @messages.command(name="threshold")
+    async def messages_threshold(self, ctx, score: int):
+        """The score at which a message is flagged as spam."""
+        if score < 1:
+            return await ctx.send("You must provide a value greater than 0.")
+        await self.config.guild(ctx.guild).message_threshold.set(score)
+        await ctx.send(f"Messages with a spam score of {score} or more will now be flagged.")
+        await self.gen_cache()
+
+    @messages.command(name="delete")
+    async def messages_delete(self, ctx, on_or_off: bool):
+        """Toggle whether flagged messages are deleted."""
+        await self.config.guild(ctx.guild).message_delete.set(on_or_off)
+        if on_or_off:
+            await ctx.send("Messages flagged as spam will now be deleted.")
+        else:
+            await ctx.send("Messages flagged as spam will no longer be deleted.")
+        await self.gen_cache()
+
     @antispamset.command(name="list")
     async def _list(self, ctx):
         """Show those currently blacklisted from using commands."""
@@ -178,6 +509,16 @@ class AntiSpam(commands.Cog):
             f"**Mod/Admin Bypass**: {'Yes' if self.config_cache['mod_bypass'] else 'No'}\n"
             f"**Logging**: {'Yes - {}'.format(channel.mention) if channel else 'No'}"
         )
+        limits = self.config_cache["limits"]
+        for scope in ("cog", "command"):
+            for name, limit in limits[scope].items():
+                msg += f"\n**{scope.capitalize()} `{name}`**: {limit['amount']} per {humanize_timedelta(seconds=limit['per'])}"
+        guild_limit = self.guild_limits.get(ctx.guild.id) if ctx.guild else None
+        if guild_limit:
+            msg += f"\n**This Server**: {guild_limit['amount']} per {humanize_timedelta(seconds=guild_limit['per'])}"
+        message_settings = self.message_guilds.get(ctx.guild.id) if ctx.guild else None
+        if message_settings:
+            msg += f"\n**Message Spam Threshold**: {message_settings['message_threshold']}{' (deleting)' if message_settings['message_delete'] else ''}"
         await ctx.maybe_send_embed(msg)
 
     @antispamset.command()
@@ -185,6 +526,7 @@ class AntiSpam(commands.Cog):
         """Remove a user from the anti-spam blacklist."""
         if user.id in self.blacklist:
             del self.blacklist[user.id]
+            await self.save_state()
             await ctx.tick()
             return
         await ctx.send(f"{user} isn't blocked from using commands.")
@@ -193,4 +535,6 @@ class AntiSpam(commands.Cog):
     async def clear(self, ctx):
         """Clear the antispam list."""
         self.blacklist = {}
+        self.expiries = []
+        await self.save_state()
         await ctx.tick()
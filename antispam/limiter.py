@@ -0,0 +1,119 @@
+import time
+from array import array
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List
+
+# Converts monotonic times to wall clock times for snapshots. It is worked out once so that
+# snapshots of unchanged state compare equal.
+WALL_OFFSET = time.time() - time.monotonic()
+
+
+class SlidingLog:
+    """Timestamps of a user's most recent commands for a single limit.
+
+    Only the last ``amount - 1`` timestamps are kept, in a fixed-size ring.
+    """
+
+    __slots__ = ("times", "index", "expires")
+
+    def __init__(self, amount: int):
+        self.times = array("d", [float("-inf")]) * max(amount - 1, 1)
+        self.index = 0
+        self.expires = 0.0
+
+    def hit(self, now: float, per: float) -> bool:
+        """Record a command, returning True if it is over the limit."""
+        oldest = self.times[self.index]
+        self.times[self.index] = now
+        self.index = (self.index + 1) % len(self.times)
+        self.expires = now + per
+        return now - oldest <= per
+
+    def recent(self) -> List[float]:
+        """Recorded timestamps, oldest first."""
+        times = self.times[self.index :] + self.times[: self.index]
+        return [t for t in times if t != float("-inf")]
+
+
+class RateLimiter:
+    """Sliding-window rate limiter keyed on arbitrary hashable keys.
+
+    Logs are evicted once their window has passed without any commands, so memory
+    only grows with the users who are actively running commands. Logs are grouped by
+    window length, each group kept in last-hit order, which is also expiry order, so
+    a long window never holds shorter ones back from being evicted.
+    """
+
+    def __init__(self):
+        self.windows: Dict[float, "OrderedDict[Hashable, SlidingLog]"] = {}
+
+    def __len__(self):
+        return sum(len(logs) for logs in self.windows.values())
+
+    def hit(self, key: Hashable, amount: int, per: float) -> bool:
+        now = time.monotonic()
+        self.evict(now)
+        logs = self.windows.get(per)
+        if logs is None:
+            logs = self.windows[per] = OrderedDict()
+        log = logs.get(key)
+        if log is None or len(log.times) != max(amount - 1, 1):
+            log = logs[key] = SlidingLog(amount)
+        logs.move_to_end(key)
+        return log.hit(now, per)
+
+    def evict(self, now: float = None):
+        now = time.monotonic() if now is None else now
+        for per, logs in list(self.windows.items()):
+            while logs:
+                key, log = next(iter(logs.items()))
+                if log.expires > now:
+                    break
+                del logs[key]
+            if not logs:
+                del self.windows[per]
+
+    def discard(self, predicate: Callable[[Hashable], bool]):
+        for logs in self.windows.values():
+            for key in [key for key in logs if predicate(key)]:
+                del logs[key]
+
+    def clear(self):
+        self.windows.clear()
+
+    def snapshot(self) -> list:
+        """Active logs as ``[key, size, per, expires, times]`` lists using wall clock times.
+
+        Expired logs are evicted first so they are never saved.
+        """
+        now = time.monotonic()
+        self.evict(now)
+        return [
+            [
+                key,
+                len(log.times),
+                per,
+                log.expires + WALL_OFFSET,
+                [t + WALL_OFFSET for t in log.recent()],
+            ]
+            for per, logs in self.windows.items()
+            for key, log in logs.items()
+        ]
+
+    def restore(self, entries: list):
+        """Load logs from :meth:`snapshot`, skipping any which expired in the meantime."""
+        now = time.monotonic()
+        # Snapshots from before logs were grouped by window have no window length.
+        entries = [entry for entry in entries if len(entry) == 5]
+        for key, size, per, expires, times in sorted(entries, key=lambda entry: entry[3]):
+            expires -= WALL_OFFSET
+            if expires <= now:
+                continue
+            if isinstance(key, list):
+                key = tuple(key)
+            log = SlidingLog(size + 1)
+            for t in times[-size:]:
+                log.times[log.index] = t - WALL_OFFSET
+                log.index = (log.index + 1) % size
+            log.expires = expires
+            self.windows.setdefault(per, OrderedDict())[key] = log
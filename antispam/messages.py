@@ -0,0 +1,134 @@
+import re
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import discord
+
+# Seconds a message counts towards another message's score.
+WINDOW = 30
+# Recent messages remembered per guild, across all of its channels.
+GUILD_HISTORY = 250
+# Simhashes at most this many bits apart are considered duplicates.
+MAX_DISTANCE = 3
+# Only the start of long messages is hashed.
+MAX_CONTENT = 500
+
+WORD = re.compile(r"\w+")
+MASK = (1 << 64) - 1
+UNHASHED = object()
+
+
+def simhash(content: str) -> Optional[int]:
+    """64-bit simhash of a message's words, similar messages differ in few bits."""
+    words = WORD.findall(content[:MAX_CONTENT].lower())
+    if not words:
+        return None
+    features = [hash(word) & MASK for word in words]
+    features += [hash(pair) & MASK for pair in zip(words, words[1:])]
+    threshold = len(features) / 2
+    value = 0
+    for bit in range(64):
+        if sum((feature >> bit) & 1 for feature in features) > threshold:
+            value |= 1 << bit
+    return value
+
+
+class Entry:
+    __slots__ = (
+        "time",
+        "author",
+        "channel",
+        "text",
+        "digest",
+        "_fingerprint",
+        "mentions",
+        "attachments",
+    )
+
+    def __init__(self, message: discord.Message, now: float):
+        self.time = now
+        self.author = message.author.id
+        self.channel = message.channel.id
+        # Normalised words, hashed exactly up front and simhashed only when compared.
+        self.text = " ".join(WORD.findall(message.content[:MAX_CONTENT].lower()))
+        self.digest = hash(self.text)
+        self._fingerprint = UNHASHED
+        self.mentions = len(message.raw_mentions) + len(message.raw_role_mentions)
+        if message.mention_everyone:
+            self.mentions += 5
+        self.attachments = len(message.attachments)
+
+    @property
+    def fingerprint(self) -> Optional[int]:
+        if self._fingerprint is UNHASHED:
+            self._fingerprint = simhash(self.text)
+        return self._fingerprint
+
+    def duplicates(self, other: "Entry") -> bool:
+        """Whether two messages have the same or nearly the same words."""
+        if not self.text or not other.text:
+            return False
+        if self.digest == other.digest and self.text == other.text:
+            return True
+        return bin(self.fingerprint ^ other.fingerprint).count("1") <= MAX_DISTANCE
+
+
+class GuildScorer:
+    """Scores messages in a guild against a bounded ring of its recent messages."""
+
+    __slots__ = ("history", "flagged")
+
+    def __init__(self):
+        self.history: "deque[Entry]" = deque(maxlen=GUILD_HISTORY)
+        self.flagged: Dict[int, float] = {}
+
+    def score(self, message: discord.Message) -> Tuple[int, List[str]]:
+        """Record a message, returning its spam score and the reasons for it."""
+        now = time.monotonic()
+        entry = Entry(message, now)
+        duplicates = cross_channel = 0
+        mentions, attachments = entry.mentions, entry.attachments
+        for other in reversed(self.history):
+            if now - other.time > WINDOW:
+                break
+            if other.author != entry.author:
+                continue
+            mentions += other.mentions
+            attachments += other.attachments
+            if entry.duplicates(other):
+                if other.channel == entry.channel:
+                    duplicates += 1
+                else:
+                    cross_channel += 1
+        self.history.append(entry)
+
+        reasons = []
+        score = 0
+        if duplicates:
+            score += 2 * duplicates
+            reasons.append(f"duplicates: {duplicates}")
+        if cross_channel:
+            score += 3 * cross_channel
+            reasons.append(f"cross-channel duplicates: {cross_channel}")
+        if mentions > 4:
+            score += 2 * (mentions - 4)
+            reasons.append(f"mentions: {mentions}")
+        if attachments > 3:
+            score += 2 * (attachments - 3)
+            reasons.append(f"attachments: {attachments}")
+        return score, reasons
+
+    def flag(self, author_id: int) -> bool:
+        """Mark an author as flagged, returning False if they already were recently."""
+        now = time.monotonic()
+        if now - self.flagged.get(author_id, float("-inf")) < WINDOW:
+            return False
+        if len(self.flagged) >= GUILD_HISTORY:
+            self.flagged = {
+                author: flagged
+                for author, flagged in self.flagged.items()
+                if now - flagged < WINDOW
+            }
+        self.flagged[author_id] = now
+        return True
@@ -1,16 +1,21 @@
 import asyncio
 import datetime
 import logging
-from collections import OrderedDict
+import time
 from copy import deepcopy
-from io import StringIO
 from typing import Counter, Optional
 
 import discord
-import pandas
 from redbot.core import Config, commands
+from redbot.core.commands.converter import TimedeltaConverter
+from redbot.core.utils.chat_formatting import box, humanize_list, humanize_timedelta, pagify
 
+from .export import EXPORTS, write_csv, write_parquet
+from .history import DAYS, UsageHistory
+from .latency import LatencyHistogram, format_duration
+from .leaderboard import Leaderboard
 from .menus import EmbedFormat, GenericMenu
+from .metrics import METRICS_HOST, MetricsServer
 
 
 def chunks(l, n):
@@ -21,11 +26,16 @@ def chunks(l, n):
 
 log = logging.getLogger("red.flare.commandstats")
 
+# Guilds written to Config at once while flushing guild usage.
+FLUSH_BATCH = 25
+# Seconds between saves of the usage history, which is written as a single blob.
+HISTORY_INTERVAL = 3600
+
 
 class CommandStats(commands.Cog):
     """Command Statistics."""
 
-    __version__ = "0.1.0"
+    __version__ = "0.8.0"
 
     def format_help_for_context(self, ctx):
         """Thanks Sinbad."""
@@ -35,11 +45,30 @@ class CommandStats(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.config = Config.get_conf(self, 1398467138476, force_registration=True)
-        default_global = {"globaldata": Counter({}), "guilddata": {}, "automated": Counter({})}
+        default_global = {
+            "globaldata": Counter({}),
+            "guilddata": {},
+            "automated": Counter({}),
+            "history": {},
+            "metrics_port": None,
+        }
         self.config.register_global(**default_global)
+        self.config.register_guild(usage={})
         self.cache = {"guild": {}, "session": Counter({}), "automated": Counter({})}
+        self.flushing = {}
+        self.flush_lock = asyncio.Lock()
         self.session = Counter()
         self.session_time = datetime.datetime.utcnow()
+        self.history = UsageHistory()
+        self.history_saved = time.monotonic()
+        self.leaderboard = Leaderboard()
+        self.automated_leaderboard = Leaderboard()
+        self.cog_leaderboards = {}
+        self.cog_totals = Leaderboard()
+        self.latencies = {}
+        self.error_counts = {}
+        self.guild_totals = Counter()
+        self.metrics_server = MetricsServer(self)
         self.bg_loop_task = self.bot.loop.create_task(self.bg_loop())
 
     async def red_get_data_for_user(self, *, user_id: int):
@@ -51,21 +80,49 @@ class CommandStats(commands.Cog):
         pass
 
     async def bg_loop(self):
+        self.history.load(await self.config.history())
+        self.leaderboard = Leaderboard(
+            Counter(await self.config.globaldata()) + self.cache["session"]
+        )
+        self.automated_leaderboard = Leaderboard(
+            Counter(await self.config.automated()) + self.cache["automated"]
+        )
+        self.cog_leaderboards = {}
+        self.cog_totals = Leaderboard()
+        port = await self.config.metrics_port()
+        if port is not None:
+            try:
+                await self.metrics_server.start(METRICS_HOST, port)
+            except OSError as exc:
+                log.error(f"Unable to serve command metrics on port {port}: ", exc_info=exc)
         await self.bot.wait_until_ready()
+        try:
+            await self.shard_guilddata()
+        except Exception as exc:
+            log.error("Exception while sharding guild data: ", exc_info=exc)
         while True:
             try:
                 await self.update_global()
                 await self.update_data()
+                if time.monotonic() - self.history_saved >= HISTORY_INTERVAL:
+                    await self.update_history()
                 await asyncio.sleep(300)
             except Exception as exc:
                 log.error("Exception in bg_loop: ", exc_info=exc)
                 self.bg_loop_task.cancel()
 
     def cog_unload(self):
-        if self.bg_loop_task:
-            self.bg_loop_task.cancel()
-        asyncio.create_task(self.update_data())
-        asyncio.create_task(self.update_global())
+        asyncio.create_task(self.shutdown())
+
+    async def shutdown(self):
+        """Stop the background loop between flushes, then flush everything left."""
+        async with self.flush_lock:
+            if self.bg_loop_task:
+                self.bg_loop_task.cancel()
+        await self.update_global()
+        await self.update_data()
+        await self.update_history()
+        await self.metrics_server.stop()
 
     def record(self, ctx, name):
         guild = ctx.message.guild
@@ -75,6 +132,7 @@ class CommandStats(commands.Cog):
                     self.cache["automated"][name] = 1
                 else:
                     self.cache["automated"][name] += 1
+                self.automated_leaderboard.add(name)
                 return
             if guild is not None:
                 if str(guild.id) not in self.cache["guild"]:
@@ -83,6 +141,7 @@ class CommandStats(commands.Cog):
                     self.cache["guild"][str(guild.id)][name] = 1
                 else:
                     self.cache["guild"][str(guild.id)][name] += 1
+                self.guild_totals[str(guild.id)] += 1
             if name not in self.cache["session"]:
                 self.cache["session"][name] = 1
             else:
@@ -91,13 +150,67 @@ class CommandStats(commands.Cog):
                 self.session[name] = 1
             else:
                 self.session[name] += 1
+            self.history.record(name)
+            self.leaderboard.add(name)
+            cog = ctx.command.cog_name if ctx.command else None
+            if cog in self.cog_leaderboards:
+                self.cog_leaderboards[cog].add(name)
+                self.cog_totals.add(cog)
+
+    def cog_leaderboard(self, cog) -> Leaderboard:
+        """Ranking of a cog's commands, built from the global one the first time it's needed."""
+        name = cog.qualified_name
+        if name not in self.cog_leaderboards:
+            commands = {x.qualified_name for x in cog.walk_commands()}
+            leaderboard = Leaderboard(
+                {
+                    command: self.leaderboard[command]
+                    for command in commands
+                    if command in self.leaderboard
+                }
+            )
+            self.cog_leaderboards[name] = leaderboard
+            self.cog_totals.remove(name)
+            self.cog_totals.add(name, leaderboard.total())
+        return self.cog_leaderboards[name]
+
+    @commands.Cog.listener()
+    async def on_cog_add(self, cog):
+        # A reloaded cog may have different commands, rebuild its index when next viewed.
+        self.cog_leaderboards.pop(cog.qualified_name, None)
 
     @commands.Cog.listener()
     async def on_command(self, ctx):
         """Record standard command events."""
+        ctx.commandstats_started = time.perf_counter()
         name = str(ctx.command)
         self.record(ctx, name)
 
+    @commands.Cog.listener()
+    async def on_command_completion(self, ctx):
+        self.record_latency(ctx)
+
+    @commands.Cog.listener()
+    async def on_command_error(self, ctx, error):
+        if ctx.command is None:
+            return
+        self.record_latency(ctx)
+        error = getattr(error, "original", error)
+        name = str(ctx.command)
+        if name not in self.error_counts:
+            self.error_counts[name] = Counter()
+        self.error_counts[name][type(error).__name__] += 1
+
+    def record_latency(self, ctx):
+        started = getattr(ctx, "commandstats_started", None)
+        if started is None:
+            return
+        del ctx.commandstats_started
+        name = str(ctx.command)
+        if name not in self.latencies:
+            self.latencies[name] = LatencyHistogram()
+        self.latencies[name].record(time.perf_counter() - started)
+
     @commands.Cog.listener()
     async def on_commandstats_action(self, ctx):
         """Record action events (i.e. other cog emits 'commandstats_action')."""
@@ -105,9 +218,11 @@ class CommandStats(commands.Cog):
         self.record(ctx, name)
 
     def build_data(self, data):
-        data = OrderedDict(sorted(data.items(), key=lambda t: t[1], reverse=True))
+        """Build menu pages from a dict, or a list of (name, amount) already ranked."""
+        if isinstance(data, dict):
+            data = sorted(data.items(), key=lambda t: t[1], reverse=True)
         stats = []
-        for cmd, amount in data.items():
+        for cmd, amount in data:
             stats.append([f"{cmd}", f"{amount} time{'s' if amount != 1 else ''}"])
         return list(chunks(stats, 15))
 
@@ -118,13 +233,12 @@ class CommandStats(commands.Cog):
 
         This command does not log the issuing command.
         """
-        await self.update_global()
-        data = await self.config.globaldata()
+        data = self.leaderboard
         if not data:
             return await ctx.send("No commands have been used yet.")
         if command is None:
             await GenericMenu(
-                source=EmbedFormat(self.build_data(data)),
+                source=EmbedFormat(self.build_data(data.top())),
                 title="Commands Used",
                 _type="Command",
                 ctx=ctx,
@@ -144,12 +258,11 @@ class CommandStats(commands.Cog):
         """Automated command stats.
 
         Commands that have `ctx.assume_yes` will qualify as automated."""
-        await self.update_global()
-        data = await self.config.automated()
+        data = self.automated_leaderboard
         if not data:
             return await ctx.send("No commands have been used yet.")
         await GenericMenu(
-            source=EmbedFormat(self.build_data(data)),
+            source=EmbedFormat(self.build_data(data.top())),
             title="Automatic Commands Used",
             _type="Command",
             ctx=ctx,
@@ -169,9 +282,7 @@ class CommandStats(commands.Cog):
         """Guild Command Stats."""
         if not server:
             server = ctx.guild
-        await self.update_data()
-        data = await self.config.guilddata()
-        data = data[str(server.id)]
+        data = await self.get_guild_data(server.id)
         if not data:
             return await ctx.send(f"No commands have been used in {server.name} yet.")
         if command is None:
@@ -223,26 +334,143 @@ class CommandStats(commands.Cog):
             else:
                 await ctx.send(f"`{command}` hasn't been used in this session!")
 
+    @cmd.command()
+    async def recent(
+        self,
+        ctx,
+        *,
+        window: TimedeltaConverter(
+            minimum=datetime.timedelta(hours=1),
+            maximum=datetime.timedelta(days=DAYS),
+            default_unit="hours",
+        ) = datetime.timedelta(days=1),
+    ):
+        """Most used commands over a recent window.
+
+        Defaults to the last 24 hours. Windows over 2 days are rounded to whole days.
+        """
+        hours = int(window.total_seconds() // 3600)
+        data = dict(self.history.top(hours, amount=150))
+        if not data:
+            return await ctx.send("No commands have been used in that time.")
+        await GenericMenu(
+            source=EmbedFormat(self.build_data(data)),
+            title=f"Commands Used in the last {humanize_timedelta(timedelta=window)}",
+            _type="Command",
+            ctx=ctx,
+        ).start(
+            ctx=ctx,
+            wait=False,
+        )
+
+    @cmd.command()
+    async def trend(self, ctx, days: Optional[int] = 14, *, command: str):
+        """Daily usage of a command over the last few days."""
+        if not 1 <= days <= DAYS:
+            return await ctx.send(f"You can view between 1 and {DAYS} days.")
+        totals = self.history.trend(command, days)
+        if not any(totals):
+            return await ctx.send(f"`{command}` hasn't been used in the last {days} days!")
+        today = datetime.datetime.utcnow().date()
+        peak = max(totals)
+        msg = [
+            f"{today - datetime.timedelta(days=len(totals) - 1 - i)} {'#' * round(amount / peak * 20):<20} {amount}"
+            for i, amount in enumerate(totals)
+        ]
+        await ctx.send(f"Daily usage of `{command}`:")
+        for page in pagify("\n".join(msg)):
+            await ctx.send(box(page))
+
+    @cmd.command()
+    async def slow(self, ctx):
+        """Slowest commands during this session.
+
+        Commands are ordered by their 95th percentile duration.
+        """
+        if not self.latencies:
+            return await ctx.send("No commands have completed in this session.")
+        data = sorted(self.latencies.items(), key=lambda t: t[1].percentile(95), reverse=True)
+        stats = [
+            [
+                name,
+                histogram.count,
+                *map(format_duration, histogram.summary()),
+                sum(self.error_counts.get(name, {}).values()),
+            ]
+            for name, histogram in data
+        ]
+        await GenericMenu(
+            source=EmbedFormat(
+                list(chunks(stats, 15)), headers=["Command", "Runs", "p50", "p95", "p99", "Errors"]
+            ),
+            title="Slowest Commands",
+            _type="Command",
+            ctx=ctx,
+            timestamp=self.session_time,
+        ).start(
+            ctx=ctx,
+            wait=False,
+        )
+
+    @cmd.command(name="errors")
+    async def _errors(self, ctx, *, command: str = None):
+        """Command errors by type during this session."""
+        stats = [
+            [name, error, amount]
+            for name, errors in self.error_counts.items()
+            if command is None or name == command
+            for error, amount in errors.most_common()
+        ]
+        if not stats:
+            return await ctx.send("No command errors have been recorded in this session.")
+        stats.sort(key=lambda t: t[2], reverse=True)
+        await GenericMenu(
+            source=EmbedFormat(list(chunks(stats, 15)), headers=["Command", "Error", "Times"]),
+            title="Command Errors",
+            _type="Command",
+            ctx=ctx,
+            timestamp=self.session_time,
+        ).start(
+            ctx=ctx,
+            wait=False,
+        )
+
+    @cmd.command()
+    async def metrics(self, ctx, port: int = None):
+        """Serve command metrics for Prometheus or other OpenMetrics scrapers.
+
+        Metrics are served locally on `http://127.0.0.1:<port>/metrics`.
+        Run without a port to stop serving them.
+        """
+        if port is None:
+            await self.metrics_server.stop()
+            await self.config.metrics_port.set(None)
+            return await ctx.send("Command metrics will no longer be served.")
+        if not 1 <= port <= 65535:
+            return await ctx.send("You must provide a valid port.")
+        try:
+            await self.metrics_server.start(METRICS_HOST, port)
+        except OSError as exc:
+            return await ctx.send(f"Unable to serve metrics on port {port}: {exc}")
+        await self.config.metrics_port.set(port)
+        await ctx.send(
+            f"Command metrics are now served on `http://{METRICS_HOST}:{port}/metrics`."
+        )
+
     @cmd.group(invoke_without_command=True)
     async def cogstats(self, ctx, *, cogname: str = None):
         """Show command stats per cog, all cogs or per session."""
-        await self.update_global()
         if cogname is not None:
             cog = self.bot.get_cog(cogname)
             if cog is None:
                 await ctx.send("No such cog.")
                 return
-            commands = set([x.qualified_name for x in cog.walk_commands()])
-            data = await self.config.globaldata()
-            a = {}
-            for command in data:
-                if command in commands:
-                    a[command] = data[command]
+            a = self.cog_leaderboard(cog)
             if not a:
                 await ctx.send(f"No commands used from {cogname} as of yet.")
                 return
             await GenericMenu(
-                source=EmbedFormat(self.build_data(a)),
+                source=EmbedFormat(self.build_data(a.top())),
                 title=f"{cogname} Commands Used",
                 _type="Command",
                 ctx=ctx,
@@ -251,15 +479,9 @@ class CommandStats(commands.Cog):
                 wait=False,
             )
         else:
-            data = await self.config.globaldata()
-            a = {}
             for cogn in self.bot.cogs:
-                cog = self.bot.get_cog(cogn)
-                commands = set([x.qualified_name for x in cog.walk_commands()])
-                a[cogn] = 0
-                for command in data:
-                    if command in commands:
-                        a[cogn] += data[command]
+                self.cog_leaderboard(self.bot.get_cog(cogn))
+            a = [(cogn, amount) for cogn, amount in self.cog_totals.top() if cogn in self.bot.cogs]
             if not a:
                 await ctx.send(f"No commands used from any cog as of yet.")
                 return
@@ -276,7 +498,6 @@ class CommandStats(commands.Cog):
     @cogstats.command(name="session")
     async def _session(self, ctx, *, cogname: str = None):
         """Cog stats in this session."""
-        await self.update_global()
         if cogname is not None:
             cog = self.bot.get_cog(cogname)
             if cog is None:
@@ -325,36 +546,135 @@ class CommandStats(commands.Cog):
             )
 
     @cmd.command()
-    async def csv(self, ctx):
-        """Return a CSV of all command actions."""
-        await self.update_global()
-        data = await self.config.globaldata()
-        df = pandas.DataFrame.from_dict(data, orient="index", columns=["Usage"])
-        df.index.name = "Commands"
-        s_buf = StringIO()
-        df.to_csv(s_buf)
-        s_buf.name = "commandstats.csv"
-        s_buf.seek(0)
-        await ctx.send(file=discord.File(s_buf))
+    async def csv(self, ctx, data: str = "global"):
+        """Return a CSV of command usage.
 
-    async def update_data(self):
-        async with self.config.guilddata() as guilddata:
-            for guild in self.cache["guild"]:
-                if guild in guilddata:
-                    olddata = Counter(guilddata[guild])
+        `data` can be `global` (default), `guilds` for usage per guild or `history` for daily
+        usage over the last 90 days.
+        """
+        await self.export(ctx, data, "csv")
+
+    @cmd.command()
+    async def parquet(self, ctx, data: str = "global"):
+        """Return a Parquet file of command usage.
+
+        Accepts the same data as `csv`. Requires pyarrow to be installed.
+        """
+        await self.export(ctx, data, "parquet")
+
+    async def export(self, ctx, data: str, fmt: str):
+        data = data.lower()
+        if data not in EXPORTS:
+            return await ctx.send(f"Data must be one of {humanize_list(list(EXPORTS))}.")
+        async with ctx.typing():
+            try:
+                if fmt == "csv":
+                    fp = await write_csv(EXPORTS[data], self.export_rows(data))
                 else:
-                    olddata = Counter({})
-                data = Counter(olddata + self.cache["guild"][guild])
-                self.cache["guild"][guild] = Counter()
-                guilddata[guild] = data
+                    fp = await write_parquet(EXPORTS[data], self.export_rows(data))
+            except RuntimeError as exc:
+                return await ctx.send(str(exc))
+        with fp:
+            filename = "commandstats" if data == "global" else f"commandstats_{data}"
+            await ctx.send(file=discord.File(fp, filename=f"{filename}.{fmt}"))
+
+    async def export_rows(self, data: str):
+        """Yield export rows without building the full table first."""
+        if data == "global":
+            for command, amount in self.leaderboard.top():
+                yield command, amount
+        elif data == "guilds":
+            for chunk in chunks(self.bot.guilds, 50):
+                for guild in chunk:
+                    usage = await self.get_guild_data(guild.id)
+                    for command, amount in usage.most_common():
+                        yield guild.id, command, amount
+                await asyncio.sleep(0)
+        elif data == "history":
+            today = datetime.datetime.utcnow().date()
+            for command in list(self.history.hours):
+                for i, amount in enumerate(self.history.trend(command, DAYS)):
+                    if amount:
+                        yield command, today - datetime.timedelta(days=DAYS - 1 - i), amount
+
+    async def update_data(self):
+        """Persist guild usage, only writing the guilds which changed since the last flush.
+
+        The pending counts are swapped for an empty buffer before anything is awaited, so
+        commands recorded mid-flush land in the next one. Guilds are written in bounded
+        batches, yielding to the event loop between them.
+        """
+        async with self.flush_lock:
+            # Guilds left over from an interrupted flush go back into the pending counts.
+            for guild, data in self.flushing.items():
+                self.cache["guild"].setdefault(guild, Counter()).update(data)
+            self.flushing, self.cache["guild"] = self.cache["guild"], {}
+            for batch in chunks(list(self.flushing), FLUSH_BATCH):
+                await asyncio.gather(*(self.persist_guild(guild) for guild in batch))
+                await asyncio.sleep(0)
+
+    async def persist_guild(self, guild: str):
+        data = self.flushing[guild]
+        try:
+            if data:
+                async with self.config.guild_from_id(int(guild)).usage() as usage:
+                    for command, amount in data.items():
+                        usage[command] = usage.get(command, 0) + amount
+        except asyncio.CancelledError:
+            self.cache["guild"].setdefault(guild, Counter()).update(data)
+            raise
+        except Exception as exc:
+            log.error(f"Unable to save command usage for guild {guild}: ", exc_info=exc)
+            self.cache["guild"].setdefault(guild, Counter()).update(data)
+        finally:
+            del self.flushing[guild]
+
+    async def shard_guilddata(self):
+        """Move the legacy single-blob guild data into per-guild storage.
+
+        Guilds are moved in small batches, yielding between them, so the one-off
+        compaction doesn't stall the bot. Each guild is removed from the blob as soon as
+        its shard is written, so an interrupted migration resumes without counting any
+        guild twice.
+        """
+        guilddata = await self.config.guilddata()
+        if not guilddata:
+            return
+        for chunk in chunks(list(guilddata.items()), 50):
+            for guild, data in chunk:
+                async with self.config.guild_from_id(int(guild)).usage() as usage:
+                    for command, amount in data.items():
+                        usage[command] = usage.get(command, 0) + amount
+                await self.config.clear_raw("guilddata", guild)
+            await asyncio.sleep(0)
+        log.info(f"Moved command usage for {len(guilddata)} guilds into per-guild storage.")
+
+    async def get_guild_data(self, guild_id: int) -> Counter:
+        """Persisted usage for a guild plus anything recorded since the last flush."""
+        data = Counter(await self.config.guild_from_id(guild_id).usage())
+        data.update(self.flushing.get(str(guild_id), {}))
+        data.update(self.cache["guild"].get(str(guild_id), {}))
+        return data
 
     async def update_global(self):
-        globaldata = await self.config.globaldata()
-        data = globaldata + self.cache["session"]
-        await self.config.globaldata.set(data)
-        self.cache["session"] = Counter({})
-
-        autodata = await self.config.automated()
-        data = autodata + self.cache["automated"]
-        await self.config.automated.set(data)
-        self.cache["automated"] = Counter({})
+        """Persist global and automated usage, in one write each.
+
+        Counts which couldn't be written, including when the flush is cancelled, are put
+        back to be written by the next one.
+        """
+        async with self.flush_lock:
+            for key, cache in (("globaldata", "session"), ("automated", "automated")):
+                if not self.cache[cache]:
+                    continue
+                counts, self.cache[cache] = self.cache[cache], Counter({})
+                try:
+                    async with self.config.get_attr(key)() as data:
+                        for command, amount in counts.items():
+                            data[command] = data.get(command, 0) + amount
+                except BaseException:
+                    self.cache[cache].update(counts)
+                    raise
+
+    async def update_history(self):
+        self.history_saved = time.monotonic()
+        await self.config.history.set(self.history.to_dict())
@@ -0,0 +1,50 @@
+import asyncio
+import csv
+import io
+import tempfile
+from typing import AsyncIterator, BinaryIO, Sequence, Tuple
+
+EXPORTS = {
+    "global": ("Commands", "Usage"),
+    "guilds": ("Guild", "Commands", "Usage"),
+    "history": ("Commands", "Date", "Usage"),
+}
+
+
+async def write_csv(header: Sequence[str], rows: AsyncIterator[Tuple]) -> BinaryIO:
+    """Write rows to a temporary CSV file one at a time, never holding the table in memory."""
+    fp = tempfile.TemporaryFile()
+    text = io.TextIOWrapper(fp, encoding="utf-8", newline="")
+    writer = csv.writer(text)
+    writer.writerow(header)
+    async for row in rows:
+        writer.writerow(row)
+    text.flush()
+    text.detach()
+    fp.seek(0)
+    return fp
+
+
+async def write_parquet(header: Sequence[str], rows: AsyncIterator[Tuple]) -> io.BytesIO:
+    """Write rows to a Parquet file column by column.
+
+    Raises ``RuntimeError`` if pyarrow isn't installed, it is only imported when needed.
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("pyarrow must be installed to export Parquet files.")
+    columns = [[] for _ in header]
+    async for row in rows:
+        for column, value in zip(columns, row):
+            column.append(value)
+
+    def write():
+        fp = io.BytesIO()
+        table = pyarrow.table(dict(zip(header, columns)))
+        pyarrow.parquet.write_table(table, fp)
+        fp.seek(0)
+        return fp
+
+    return await asyncio.get_running_loop().run_in_executor(None, write)
@@ -0,0 +1,117 @@
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+HOURS = 48
+DAYS = 90
+
+
+def current_hour() -> int:
+    return int(time.time() // 3600)
+
+
+class UsageHistory:
+    """Rolling per-command usage, in hourly buckets rolled up into daily ones.
+
+    Each command keeps a ring of ``HOURS`` hourly counts and a ring of ``DAYS`` daily
+    counts, both backed by 4-byte ``array`` items so a command costs about half a
+    kilobyte. When an hour falls out of the hourly ring its count is added to the daily
+    bucket it belongs to, so every use is counted in exactly one ring.
+    """
+
+    def __init__(self, data: Optional[dict] = None):
+        self.hour = current_hour()
+        self.hours: Dict[str, array] = {}
+        self.days: Dict[str, array] = {}
+        if data:
+            self.load(data)
+
+    def load(self, data: dict):
+        self.hour = data.get("hour", self.hour)
+        for command, counts in data.get("hours", {}).items():
+            self.hours[command] = array("I", counts[:HOURS] + [0] * (HOURS - len(counts)))
+        for command, counts in data.get("days", {}).items():
+            self.days[command] = array("I", counts[:DAYS] + [0] * (DAYS - len(counts)))
+        for command in self.days.keys() - self.hours.keys():
+            self.hours[command] = array("I", [0]) * HOURS
+        for command in self.hours.keys() - self.days.keys():
+            self.days[command] = array("I", [0]) * DAYS
+        self.advance()
+
+    def to_dict(self) -> dict:
+        return {
+            "hour": self.hour,
+            "hours": {cmd: counts.tolist() for cmd, counts in self.hours.items() if any(counts)},
+            "days": {cmd: counts.tolist() for cmd, counts in self.days.items() if any(counts)},
+        }
+
+    def _buckets(self, command: str) -> Tuple[array, array]:
+        hours = self.hours.get(command)
+        if hours is None:
+            hours = self.hours[command] = array("I", [0]) * HOURS
+            self.days[command] = array("I", [0]) * DAYS
+        return hours, self.days[command]
+
+    def advance(self, now: Optional[int] = None):
+        """Move the newest bucket up to the current hour, rolling expired hours into days."""
+        now = current_hour() if now is None else now
+        if now <= self.hour:
+            return
+        old_day, now_day = self.hour // 24, now // 24
+        for day in range(max(old_day + 1, now_day - DAYS + 1), now_day + 1):
+            for counts in self.days.values():
+                counts[day % DAYS] = 0
+        for hour in range(self.hour - HOURS + 1, min(self.hour, now - HOURS) + 1):
+            slot, day = hour % HOURS, hour // 24
+            for command, counts in self.hours.items():
+                if counts[slot] and day > now_day - DAYS:
+                    self.days[command][day % DAYS] += counts[slot]
+                counts[slot] = 0
+        self.hour = now
+
+    def record(self, command: str, amount: int = 1):
+        self.advance()
+        self._buckets(command)[0][self.hour % HOURS] += amount
+
+    def _day_totals(self, command: str, days: int) -> List[int]:
+        """Totals for each of the last ``days`` days, oldest first."""
+        now_day = self.hour // 24
+        counts = self.days[command]
+        totals = [counts[day % DAYS] for day in range(now_day - days + 1, now_day + 1)]
+        hours = self.hours[command]
+        for hour in range(self.hour - HOURS + 1, self.hour + 1):
+            index = hour // 24 - (now_day - days + 1)
+            if 0 <= index < days:
+                totals[index] += hours[hour % HOURS]
+        return totals
+
+    def window(self, hours: int) -> Dict[str, int]:
+        """Usage per command over the last ``hours`` hours.
+
+        Windows up to ``HOURS`` are exact; longer ones are rounded to whole days.
+        """
+        self.advance()
+        totals = {}
+        if hours <= HOURS:
+            slots = [hour % HOURS for hour in range(self.hour - hours + 1, self.hour + 1)]
+            for command, counts in self.hours.items():
+                total = sum(counts[slot] for slot in slots)
+                if total:
+                    totals[command] = total
+            return totals
+        days = min(DAYS, -(-hours // 24))
+        for command in self.hours:
+            total = sum(self._day_totals(command, days))
+            if total:
+                totals[command] = total
+        return totals
+
+    def top(self, hours: int, amount: int = 10) -> List[Tuple[str, int]]:
+        return sorted(self.window(hours).items(), key=lambda t: t[1], reverse=True)[:amount]
+
+    def trend(self, command: str, days: int = 14) -> List[int]:
+        """Daily totals for a command over the last ``days`` days, oldest first."""
+        self.advance()
+        if command not in self.hours:
+            return [0] * min(days, DAYS)
+        return self._day_totals(command, min(days, DAYS))
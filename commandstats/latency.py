@@ -0,0 +1,50 @@
+from array import array
+from bisect import bisect_left
+from typing import Tuple
+
+# Upper bounds, in seconds, of each histogram bucket. Anything slower lands in a final
+# overflow bucket.
+BOUNDS = tuple(0.001 * (1 << i) for i in range(18))
+
+
+class LatencyHistogram:
+    """Fixed-size, log-scaled histogram of command durations."""
+
+    __slots__ = ("buckets", "count", "total")
+
+    def __init__(self):
+        self.buckets = array("L", [0]) * (len(BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float):
+        self.buckets[bisect_left(BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, pct: float) -> float:
+        """Upper bound of the bucket holding the given percentile."""
+        if not self.count:
+            return 0.0
+        target = self.count * pct / 100
+        seen = 0
+        for index, amount in enumerate(self.buckets):
+            seen += amount
+            if seen >= target:
+                break
+        return BOUNDS[index] if index < len(BOUNDS) else float("inf")
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self) -> Tuple[float, float, float]:
+        return self.percentile(50), self.percentile(95), self.percentile(99)
+
+
+def format_duration(seconds: float) -> str:
+    if seconds == float("inf"):
+        return f">{BOUNDS[-1]:.0f}s"
+    if seconds < 1:
+        return f"{seconds * 1000:.0f}ms"
+    return f"{seconds:.1f}s"
@@ -0,0 +1,53 @@
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+
+class Leaderboard:
+    """Usage counts kept alongside a ranking ordered by count.
+
+    Each increment moves a single entry within the ranking, so reading the top
+    entries never needs to sort the whole set of counts.
+    """
+
+    __slots__ = ("_counts", "_ranking")
+
+    def __init__(self, data: Optional[Dict[str, int]] = None):
+        self._counts: Dict[str, int] = dict(data or {})
+        self._ranking: List[Tuple[int, str]] = sorted(
+            (-amount, key) for key, amount in self._counts.items()
+        )
+
+    def __len__(self):
+        return len(self._counts)
+
+    def __iter__(self):
+        return iter(self._counts)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._counts
+
+    def __getitem__(self, key: str) -> int:
+        return self._counts[key]
+
+    def get(self, key: str, default: int = 0) -> int:
+        return self._counts.get(key, default)
+
+    def add(self, key: str, amount: int = 1):
+        old = self._counts.get(key)
+        if old is not None:
+            del self._ranking[bisect_left(self._ranking, (-old, key))]
+            amount += old
+        self._counts[key] = amount
+        insort(self._ranking, (-amount, key))
+
+    def remove(self, key: str):
+        old = self._counts.pop(key, None)
+        if old is not None:
+            del self._ranking[bisect_left(self._ranking, (-old, key))]
+
+    def top(self, amount: Optional[int] = None) -> List[Tuple[str, int]]:
+        ranking = self._ranking if amount is None else self._ranking[:amount]
+        return [(key, -count) for count, key in ranking]
+
+    def total(self) -> int:
+        return sum(self._counts.values())
@@ -1,6 +1,6 @@
 import contextlib
 import datetime
-from typing import Any, Dict, Iterable, Optional
+from typing import Any, Dict, Iterable, List, Optional
 
 import discord
 import tabulate
@@ -121,8 +121,9 @@ class GenericMenu(menus.MenuPages, inherit_buttons=False):
 
 
 class EmbedFormat(menus.ListPageSource):
-    def __init__(self, entries: Iterable[str]):
+    def __init__(self, entries: Iterable[str], headers: Optional[List[str]] = None):
         super().__init__(entries, per_page=1)
+        self.headers = headers
 
     async def format_page(self, menu: GenericMenu, data) -> str:
         stats = []
@@ -132,7 +133,8 @@ class EmbedFormat(menus.ListPageSource):
             title=menu.title,
             colour=await menu.ctx.embed_color(),
             description=box(
-                tabulate.tabulate(stats, headers=[menu._type, "Times Used"]), lang="prolog"
+                tabulate.tabulate(stats, headers=self.headers or [menu._type, "Times Used"]),
+                lang="prolog",
             ),
         )
         if menu.timestamp is not None:
@@ -0,0 +1,118 @@
+import logging
+from typing import Iterator, Optional
+
+from aiohttp import web
+
+from .latency import BOUNDS
+
+log = logging.getLogger("red.flare.commandstats.metrics")
+
+METRICS_HOST = "127.0.0.1"
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+# Samples rendered before the response is flushed and the event loop gets a turn.
+CHUNK_SIZE = 500
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render(cog) -> Iterator[str]:
+    """Render the cog's in-memory counters in the OpenMetrics text format.
+
+    Only the keys of each mapping are snapshotted, values are read as they are
+    rendered, and the output is yielded in chunks so a large scrape never builds
+    the whole exposition at once.
+    """
+    lines = []
+
+    def flush():
+        chunk = "".join(lines)
+        lines.clear()
+        return chunk
+
+    counters = (
+        ("commandstats_commands", "Commands used since stats began.", "command", cog.leaderboard),
+        ("commandstats_session_commands", "Commands used this session.", "command", cog.session),
+        (
+            "commandstats_automated_commands",
+            "Automated commands used since stats began.",
+            "command",
+            cog.automated_leaderboard,
+        ),
+        (
+            "commandstats_guild_commands",
+            "Commands used per guild this session.",
+            "guild",
+            cog.guild_totals,
+        ),
+    )
+    for name, description, label, data in counters:
+        lines.append(f"# TYPE {name} counter\n# HELP {name} {description}\n")
+        for index, key in enumerate(list(data)):
+            lines.append(f'{name}_total{{{label}="{escape(key)}"}} {data.get(key, 0)}\n')
+            if index % CHUNK_SIZE == CHUNK_SIZE - 1:
+                yield flush()
+
+    name = "commandstats_command_duration_seconds"
+    lines.append(f"# TYPE {name} histogram\n# HELP {name} Command durations this session.\n")
+    for index, command in enumerate(list(cog.latencies)):
+        histogram = cog.latencies[command]
+        label = escape(command)
+        cumulative = 0
+        for bound, amount in zip(BOUNDS, histogram.buckets):
+            cumulative += amount
+            lines.append(f'{name}_bucket{{command="{label}",le="{bound}"}} {cumulative}\n')
+        lines.append(f'{name}_bucket{{command="{label}",le="+Inf"}} {histogram.count}\n')
+        lines.append(f'{name}_count{{command="{label}"}} {histogram.count}\n')
+        lines.append(f'{name}_sum{{command="{label}"}} {histogram.total}\n')
+        if index % 20 == 19:
+            yield flush()
+
+    name = "commandstats_command_errors"
+    lines.append(f"# TYPE {name} counter\n# HELP {name} Command errors this session.\n")
+    for command in list(cog.error_counts):
+        for error, amount in list(cog.error_counts[command].items()):
+            lines.append(
+                f'{name}_total{{command="{escape(command)}",error="{escape(error)}"}} {amount}\n'
+            )
+        if len(lines) >= CHUNK_SIZE:
+            yield flush()
+
+    lines.append("# EOF\n")
+    yield flush()
+
+
+class MetricsServer:
+    """Local HTTP server exposing CommandStats counters for scraping."""
+
+    def __init__(self, cog):
+        self.cog = cog
+        self.runner: Optional[web.AppRunner] = None
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": CONTENT_TYPE})
+        await response.prepare(request)
+        for chunk in render(self.cog):
+            await response.write(chunk.encode())
+        await response.write_eof()
+        return response
+
+    async def start(self, host: str, port: int):
+        await self.stop()
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        try:
+            await site.start()
+        except OSError:
+            await self.stop()
+            raise
+        log.info(f"Serving command metrics on http://{host}:{port}/metrics")
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
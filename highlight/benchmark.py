@@ -0,0 +1,111 @@
+"""Benchmark highlight matching against synthetic channels.
+
+This drives the same matching path as ``Highlight.on_message`` without Discord, so a
+matcher change can be measured before it is deployed. Run it from the cog folder:
+
+    python benchmark.py --users 500 --words 10 --length 200
+"""
+
+import argparse
+import random
+import string
+import time
+
+try:
+    from .matcher import HighlightMatcher, find_highlights
+except ImportError:
+    from matcher import HighlightMatcher, find_highlights
+
+
+def random_word(rng: random.Random) -> str:
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10)))
+
+
+def build_channel(rng: random.Random, vocabulary, users: int, words: int, boundary: bool):
+    """Build a channel's ``highlight`` config in the same shape Config stores it."""
+    return {
+        str(100000000000000000 + user): {
+            word: {"toggle": True, "bots": False, "boundary": boundary, "type": "word"}
+            for word in rng.sample(vocabulary, words)
+        }
+        for user in range(users)
+    }
+
+
+def build_messages(rng: random.Random, vocabulary, count: int, length: int, hit_rate: float):
+    messages = []
+    for _ in range(count):
+        parts = []
+        size = 0
+        while size < length:
+            if rng.random() < hit_rate:
+                word = rng.choice(vocabulary)
+            else:
+                word = random_word(rng)
+            parts.append(word.upper() if rng.random() < 0.1 else word)
+            size += len(word) + 1
+        messages.append(" ".join(parts)[:length])
+    return messages
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(args, boundary: bool):
+    rng = random.Random(args.seed)
+    vocabulary = sorted({random_word(rng) for _ in range(args.vocabulary)})
+    words = min(args.words, len(vocabulary))
+    channels = [
+        build_channel(rng, vocabulary, args.users, words, boundary) for _ in range(args.channels)
+    ]
+    start = time.perf_counter()
+    matchers = [HighlightMatcher(channel) for channel in channels]
+    build = time.perf_counter() - start
+    messages = build_messages(rng, vocabulary, args.messages, args.length, args.hit_rate)
+
+    latencies = []
+    highlighted = 0
+    start = time.perf_counter()
+    for index, content in enumerate(messages):
+        matcher = matchers[index % len(matchers)]
+        before = time.perf_counter()
+        matches = find_highlights([matcher], content, 0)
+        latencies.append(time.perf_counter() - before)
+        highlighted += len(matches)
+    elapsed = time.perf_counter() - start
+
+    print(f"boundary={boundary}")
+    print(f"  matcher build:   {build / len(matchers) * 1000:.2f}ms per channel")
+    print(f"  messages/sec:    {len(messages) / elapsed:,.0f}")
+    print(f"  p50 latency:     {percentile(latencies, 50) * 1e6:,.1f}us")
+    print(f"  p99 latency:     {percentile(latencies, 99) * 1e6:,.1f}us")
+    print(f"  users/message:   {highlighted / len(messages):.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--channels", type=int, default=10, help="Synthetic channels.")
+    parser.add_argument("--users", type=int, default=200, help="Users per channel.")
+    parser.add_argument("--words", type=int, default=5, help="Highlighted words per user.")
+    parser.add_argument("--vocabulary", type=int, default=5000, help="Distinct words.")
+    parser.add_argument("--messages", type=int, default=10000, help="Messages to match.")
+    parser.add_argument("--length", type=int, default=200, help="Message length.")
+    parser.add_argument(
+        "--hit-rate", type=float, default=0.05, help="Chance each word is a highlighted one."
+    )
+    parser.add_argument(
+        "--boundary",
+        choices=("on", "off", "both"),
+        default="both",
+        help="Whether highlights use word boundaries.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for boundary in {"on": [True], "off": [False], "both": [False, True]}[args.boundary]:
+        run(args, boundary)
+
+
+if __name__ == "__main__":
+    main()
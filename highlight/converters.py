@@ -0,0 +1,20 @@
+from discord.ext.commands.converter import Converter
+from discord.ext.commands.errors import BadArgument
+
+from .matcher import HIGHLIGHT_TYPES
+
+
+class HighlightType(Converter):
+    """Convert a flag such as ``--regex`` into one of the supported highlight types.
+
+    Types must be given as flags so that highlights starting with a type's name are
+    still parsed as text.
+    """
+
+    async def convert(self, ctx, argument):
+        flag = argument.lower()
+        if not flag.startswith("--") or flag[2:] not in HIGHLIGHT_TYPES:
+            raise BadArgument(
+                f"Highlight type must be one of {', '.join('--' + t for t in HIGHLIGHT_TYPES)}."
+            )
+        return flag[2:]
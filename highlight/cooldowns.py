@@ -0,0 +1,76 @@
+import time
+from collections import OrderedDict
+from typing import Hashable, Tuple
+
+
+class TTLCache:
+    """Set of keys which expire ``ttl`` seconds after they were last touched.
+
+    Keys are kept in touch order, so expiring only ever looks at the oldest entries. Both
+    touching and checking a key expire old ones, keeping the cache bounded by the keys
+    touched within the last ``ttl`` seconds.
+    """
+
+    __slots__ = ("ttl", "_data")
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, float]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        self.expire()
+        return key in self._data
+
+    def touch(self, key: Hashable):
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        self._data[key] = now + self.ttl
+        self._data.move_to_end(key)
+        self.expire(now)
+
+    def expire(self, now: float = None):
+        now = time.monotonic() if now is None else now
+        data = self._data
+        while data:
+            key, deadline = next(iter(data.items()))
+            if deadline > now:
+                break
+            del data[key]
+
+    def clear(self):
+        self._data.clear()
+
+
+class HighlightCooldowns:
+    """In-memory per-user, per-channel highlight suppression.
+
+    A user is not highlighted in a channel again until ``cooldown`` seconds after their
+    last highlight there, nor while they have spoken in that channel within the last
+    ``activity`` seconds.
+    """
+
+    def __init__(self, cooldown: float, activity: float):
+        self.notified = TTLCache(cooldown)
+        self.active = TTLCache(activity)
+
+    def configure(self, *, cooldown: float = None, activity: float = None):
+        if cooldown is not None:
+            self.notified.ttl = cooldown
+            self.notified.clear()
+        if activity is not None:
+            self.active.ttl = activity
+            self.active.clear()
+
+    def seen(self, user_id: int, channel_id: int):
+        self.active.touch((user_id, channel_id))
+
+    def suppressed(self, user_id: int, channel_id: int) -> bool:
+        key: Tuple[int, int] = (user_id, channel_id)
+        return key in self.active or key in self.notified
+
+    def notify(self, user_id: int, channel_id: int):
+        self.notified.touch((user_id, channel_id))
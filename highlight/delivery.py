@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Dict, List, Tuple
+
+import discord
+from redbot.core.utils.chat_formatting import humanize_list, inline
+
+logger = logging.getLogger("red.flare.highlight.delivery")
+
+
+def percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class HighlightDelivery:
+    """Background queue that sends highlight DMs outside of ``on_message``.
+
+    Message context is fetched once per message and shared between every recipient.
+    Highlights for the same user that arrive within ``coalesce`` seconds are merged into
+    one DM, and no user is sent more than one DM every ``interval`` seconds.
+    """
+
+    def __init__(self, bot, *, coalesce: float = 5.0, interval: float = 10.0):
+        self.bot = bot
+        self.coalesce = coalesce
+        self.interval = interval
+        self.queue: asyncio.Queue = asyncio.Queue()
+        # user id -> [(message, words, context, queued at), ...]
+        self.pending: Dict[int, List[Tuple[discord.Message, List[str], str, float]]] = {}
+        self.last_sent: Dict[int, float] = {}
+        self.flushers: Dict[int, asyncio.Task] = {}
+        self.latencies = deque(maxlen=1000)
+        self.delivered = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+        for task in self.flushers.values():
+            task.cancel()
+        self.flushers.clear()
+
+    def enqueue(self, message: discord.Message, recipients: Dict[discord.Member, List[str]]):
+        self.queue.put_nowait((message, recipients, time.monotonic()))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "queued": self.queue.qsize(),
+            "pending": sum(len(x) for x in self.pending.values()),
+            "delivered": self.delivered,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+            "p50": percentile(self.latencies, 50),
+            "p99": percentile(self.latencies, 99),
+        }
+
+    async def run(self):
+        while True:
+            message, recipients, queued = await self.queue.get()
+            try:
+                context = await self.fetch_context(message)
+                for member, words in recipients.items():
+                    self.schedule(member, message, words, context, queued)
+            except Exception as exc:
+                logger.error("Exception while queueing highlights: ", exc_info=exc)
+
+    async def fetch_context(self, message: discord.Message) -> str:
+        msglist = [message]
+        async for messages in message.channel.history(limit=5, before=message, oldest_first=False):
+            msglist.append(messages)
+        msglist.reverse()
+        context = "\n".join([f"**{x.author}**: {x.content}" for x in msglist])
+        if len(context) > 2000:
+            context = "**Context omitted due to message size limits.\n**"
+        return context
+
+    def schedule(self, member, message, words, context, queued):
+        entries = self.pending.setdefault(member.id, [])
+        entries.append((message, words, context, queued))
+        if member.id in self.flushers:
+            self.coalesced += 1
+            return
+        now = time.monotonic()
+        if len(self.last_sent) > 1000:
+            self.last_sent = {
+                user: sent for user, sent in self.last_sent.items() if now - sent < self.interval
+            }
+        ready = max(now + self.coalesce, self.last_sent.get(member.id, 0) + self.interval)
+        self.flushers[member.id] = asyncio.create_task(self.flush(member, ready - now))
+
+    async def flush(self, member: discord.Member, delay: float):
+        await asyncio.sleep(delay)
+        # Anything queued for this user from here on gets a new flusher.
+        self.flushers.pop(member.id, None)
+        entries = self.pending.pop(member.id, [])
+        if not entries:
+            return
+        self.last_sent[member.id] = time.monotonic()
+        try:
+            content, embed = self.build(entries)
+            await member.send(content, embed=embed)
+        except discord.HTTPException:
+            self.failed += 1
+            return
+        except Exception as exc:
+            self.failed += 1
+            logger.error("Exception while sending highlights: ", exc_info=exc)
+            return
+        self.delivered += 1
+        now = time.monotonic()
+        self.latencies.extend(now - entry[3] for entry in entries)
+
+    def build(self, entries):
+        if len(entries) == 1:
+            message, words, context, _ = entries[0]
+            embed = discord.Embed(
+                title="Context:",
+                colour=0xFF0000,
+                timestamp=message.created_at,
+                description="{}".format(context),
+            )
+            embed.add_field(name="Jump", value=f"[Click for context]({message.jump_url})")
+            return (
+                f"Your highlighted word{'s' if len(words) > 1 else ''} {humanize_list(list(map(inline, words)))} was mentioned in {message.channel.mention} in {message.guild.name} by {message.author.display_name}.\n",
+                embed,
+            )
+        words = []
+        for entry in entries:
+            for word in entry[1]:
+                if word not in words:
+                    words.append(word)
+        embed = discord.Embed(
+            title="Highlights:", colour=0xFF0000, timestamp=entries[-1][0].created_at
+        )
+        for message, _, _, _ in entries[-10:]:
+            content = message.content
+            if len(content) > 200:
+                content = f"{content[:197]}..."
+            embed.add_field(
+                name=f"{message.author.display_name} in #{message.channel} ({message.guild.name})",
+                value=f"{content}\n[Click for context]({message.jump_url})",
+                inline=False,
+            )
+        if len(entries) > 10:
+            embed.set_footer(text=f"{len(entries) - 10} older highlights omitted.")
+        return (
+            f"Your highlighted word{'s' if len(words) > 1 else ''} {humanize_list(list(map(inline, words)))} {'were' if len(words) > 1 else 'was'} mentioned {len(entries)} times.\n",
+            embed,
+        )
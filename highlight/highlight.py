@@ -1,15 +1,29 @@
 import asyncio
 import logging
 import re
+from copy import deepcopy
 from io import BytesIO
 from typing import Literal, Optional
 
 import discord
 import tabulate
 from redbot.core import Config, commands
-from redbot.core.utils.chat_formatting import box, humanize_list, inline
+from redbot.core.commands.converter import TimedeltaConverter
+from redbot.core.utils.chat_formatting import box, humanize_timedelta
 from redbot.core.utils.predicates import MessagePredicate
 
+from .converters import HighlightType
+from .cooldowns import HighlightCooldowns
+from .delivery import HighlightDelivery
+from .matcher import (
+    PATTERN_BUDGET,
+    HighlightMatcher,
+    compile_pattern,
+    find_highlights,
+    pattern_cost,
+)
+from .permissions import PermissionCache
+
 logger = logging.getLogger("red.flare.highlight")
 
 
@@ -19,23 +33,37 @@ class Highlight(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.config = Config.get_conf(self, identifier=1398467138476, force_registration=True)
-        self.config.register_global(migrated=False)
+        self.config.register_global(migrated=False, cooldown=60, activity=60)
         default_channel = {"highlight": {}}
         self.config.register_channel(**default_channel)
+        self.config.register_guild(**default_channel)
         self.highlightcache = {}
-        self.recache = {}
+        self.guildcache = {}
+        self.cache_versions = {}
+        self.matchers = {}
+        self.cooldowns = HighlightCooldowns(60, 60)
+        self.permissions = PermissionCache()
+        self.delivery = HighlightDelivery(bot)
+        self.delivery.start()
+
+    def cog_unload(self):
+        self.delivery.stop()
 
     async def red_get_data_for_user(self, *, user_id: int):
         data = []
         config = await self.config.all_channels()
         for channel in config:
             if str(user_id) in config[channel]["highlight"]:
-                data.append(channel, config[channel]["highlight"][str(user_id)])
-        if data is None:
+                data.append(("Channel", channel, config[channel]["highlight"][str(user_id)]))
+        config = await self.config.all_guilds()
+        for guild in config:
+            if str(user_id) in config[guild]["highlight"]:
+                data.append(("Guild", guild, config[guild]["highlight"][str(user_id)]))
+        if not data:
             return {}
         contents = f"Highlight Data for Discord user with ID {user_id}:\n"
         for highlight in data:
-            contents += f"- Channel: {highlight[0]} | Highlighted Word: {highlight[1]}\n"
+            contents += f"- {highlight[0]}: {highlight[1]} | Highlighted Word: {highlight[2]}\n"
         return {"user_data.txt": BytesIO(contents.encode())}
 
     async def red_delete_data_for_user(
@@ -52,9 +80,18 @@ class Highlight(commands.Cog):
         for channel in data:
             async with self.config.channel_from_id(channel).highlight() as highlight:
                 del highlight[str(user_id)]
-        await self.generate_cache()
+            self.update_cache(channel, user_id, None)
+        data = []
+        config = await self.config.all_guilds()
+        for guild in config:
+            if str(user_id) in config[guild]["highlight"]:
+                data.append(guild)
+        for guild in data:
+            async with self.config.guild_from_id(guild).highlight() as highlight:
+                del highlight[str(user_id)]
+            self.update_cache(guild, user_id, None, scope="guild")
 
-    __version__ = "1.4.0"
+    __version__ = "1.8.0"
 
     def format_help_for_context(self, ctx):
         """Thanks Sinbad."""
@@ -64,9 +101,53 @@ class Highlight(commands.Cog):
     async def initalize(self):
         await self.migrate_config()
         await self.generate_cache()
+        self.cooldowns.configure(
+            cooldown=await self.config.cooldown(), activity=await self.config.activity()
+        )
 
     async def generate_cache(self):
         self.highlightcache = await self.config.all_channels()
+        self.guildcache = await self.config.all_guilds()
+        self.cache_versions = {}
+        self.matchers = {}
+
+    def _get_cache(self, scope: str) -> dict:
+        return self.guildcache if scope == "guild" else self.highlightcache
+
+    def update_cache(
+        self, cache_id: int, user_id: int, words: Optional[dict], *, scope: str = "channel"
+    ):
+        """Patch a single user's highlights for a channel or guild in the cache.
+
+        Only the affected channel's or guild's version is bumped, so every other
+        matcher stays compiled. Versions and matchers are keyed by scope as well, since
+        a guild's original default channel shares its ID.
+        """
+        cache = self._get_cache(scope)
+        highlights = cache.setdefault(cache_id, {"highlight": {}})["highlight"]
+        if words:
+            highlights[str(user_id)] = deepcopy(words)
+        else:
+            highlights.pop(str(user_id), None)
+        key = (scope, cache_id)
+        if not highlights:
+            del cache[cache_id]
+            self.matchers.pop(key, None)
+        self.cache_versions[key] = self.cache_versions.get(key, 0) + 1
+
+    def get_matcher(self, cache_id: int, *, scope: str = "channel") -> Optional[HighlightMatcher]:
+        """Return the compiled matcher for a channel or guild, rebuilding it if stale."""
+        key = (scope, cache_id)
+        version = self.cache_versions.get(key, 0)
+        cached = self.matchers.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        data = self._get_cache(scope).get(cache_id)
+        if data is None:
+            return None
+        matcher = HighlightMatcher(data.get("highlight", {}))
+        self.matchers[key] = (version, matcher)
+        return matcher
 
     async def migrate_config(self):
         if not await self.config.migrated():
@@ -94,69 +175,92 @@ class Highlight(commands.Cog):
             return
         if await self.bot.cog_disabled_in_guild(self, message.guild):
             return
-        highlight = self.highlightcache.get(message.channel.id)
-        if highlight is None:
+        matchers = [
+            matcher
+            for matcher in (
+                self.get_matcher(message.channel.id),
+                self.get_matcher(message.guild.id, scope="guild"),
+            )
+            if matcher
+        ]
+        if not matchers:
             return
-        highlight = highlight.get("highlight", [])
-        for user in highlight:
-            if int(user) == message.author.id:
+        self.cooldowns.seen(message.author.id, message.channel.id)
+        matches = find_highlights(
+            matchers, message.content, message.author.id, bot=message.author.bot
+        )
+        recipients = {}
+        for user, highlighted_words in matches.items():
+            if self.cooldowns.suppressed(int(user), message.channel.id):
                 continue
-            highlighted_words = []
-            for word in highlight[user]:
-                if highlight[user][word].get("boundary", False):
-                    if word.lower() in self.recache:
-                        pattern = self.recache[word.lower()]
-                    else:
-                        pattern = re.compile(rf"\b{re.escape(word.lower())}\b", flags=re.I)
-                        self.recache[word.lower()] = pattern
-                    if set(pattern.findall(message.content.lower())):
-                        highlighted_usr = message.guild.get_member(int(user))
-                        if highlighted_usr is None:
-                            continue
-                        if not message.channel.permissions_for(highlighted_usr).read_messages:
-                            continue
-                        if message.author.bot:
-                            if not highlight[user][word]["bots"]:
-                                continue
-
-                        if not highlight[user][word]["toggle"]:
-                            continue
-                        highlighted_words.append(word)
-                elif word.lower() in message.content.lower():
-                    highlighted_usr = message.guild.get_member(int(user))
-                    if highlighted_usr is None:
-                        continue
-                    if not message.channel.permissions_for(highlighted_usr).read_messages:
-                        continue
-                    if message.author.bot:
-                        if not highlight[user][word]["bots"]:
-                            continue
-
-                    if not highlight[user][word]["toggle"]:
-                        continue
-                    highlighted_words.append(word)
-            if highlighted_words:
-                msglist = []
-                msglist.append(message)
-                async for messages in message.channel.history(
-                    limit=5, before=message, oldest_first=False
-                ):
-                    msglist.append(messages)
-                msglist.reverse()
-                context = "\n".join([f"**{x.author}**: {x.content}" for x in msglist])
-                if len(context) > 2000:
-                    context = "**Context omitted due to message size limits.\n**"
-                embed = discord.Embed(
-                    title="Context:",
-                    colour=0xFF0000,
-                    timestamp=message.created_at,
-                    description="{}".format(context),
-                )
-                embed.add_field(name="Jump", value=f"[Click for context]({message.jump_url})")
-                await highlighted_usr.send(
-                    f"Your highlighted word{'s' if len(highlighted_words) > 1 else ''} {humanize_list(list(map(inline, highlighted_words)))} was mentioned in {message.channel.mention} in {message.guild.name} by {message.author.display_name}.\n",
-                    embed=embed,
-                )
+            highlighted_usr = message.guild.get_member(int(user))
+            if highlighted_usr is None:
+                continue
+            if not self.permissions.can_read(message.channel, highlighted_usr):
+                continue
+            self.cooldowns.notify(highlighted_usr.id, message.channel.id)
+            recipients[highlighted_usr] = highlighted_words
+        if recipients:
+            self.delivery.enqueue(message, recipients)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before, after):
+        if before.overwrites != after.overwrites or before.category_id != after.category_id:
+            self.permissions.invalidate_channel(after.guild.id, after.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        self.permissions.invalidate_channel(channel.guild.id, channel.id)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before, after):
+        if before.roles != after.roles:
+            self.permissions.invalidate_member(after.guild.id, after.id)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        self.permissions.invalidate_member(member.guild.id, member.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before, after):
+        if before.permissions != after.permissions:
+            self.permissions.invalidate_guild(after.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        self.permissions.invalidate_guild(role.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_update(self, before, after):
+        if before.owner_id != after.owner_id:
+            self.permissions.invalidate_guild(after.id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.permissions.invalidate_guild(guild.id)
+
+    async def prepare_highlight(self, ctx, text: str, _type: str) -> Optional[str]:
+        """Return the key to store a highlight under, or None if the pattern was rejected."""
+        if _type == "word":
+            return text.lower()
+        if _type == "wildcard":
+            text = text.lower()
+        try:
+            compiled = (
+                compile_pattern(text, {"type": _type}),
+                compile_pattern(text, {"type": _type, "boundary": True}),
+            )
+        except re.error as exc:
+            await ctx.send(f"That {_type} pattern is invalid: {exc}")
+            return None
+        for pattern in compiled:
+            cost = await self.bot.loop.run_in_executor(None, pattern_cost, pattern)
+            if cost > PATTERN_BUDGET:
+                break
+        if cost > PATTERN_BUDGET:
+            await ctx.send(f"That {_type} pattern is too slow to be used as a highlight.")
+            return None
+        return text
 
     def channel_check(self, ctx, channel):
         return (
@@ -170,32 +274,46 @@ class Highlight(commands.Cog):
         """Highlighting Commands."""
 
     @highlight.command()
-    async def add(self, ctx, channel: Optional[discord.TextChannel] = None, *, text: str):
+    async def add(
+        self,
+        ctx,
+        channel: Optional[discord.TextChannel] = None,
+        _type: Optional[HighlightType] = "word",
+        *,
+        text: str,
+    ):
         """Add a word to be highlighted on.
 
         Text will be converted to lowercase.\nCan also provide an optional channel arguement for
         the highlight to be applied to that channel.
+        The type can be `--word` (default), `--regex` or `--wildcard`, where `*` matches any
+        run of non-space characters and `?` matches one. Patterns that are too slow will be
+        rejected.
         """
         channel = channel or ctx.channel
         check = self.channel_check(ctx, channel)
         if not check:
             await ctx.send("Either you or the bot does not have permission for that channel.")
             return
+        word = await self.prepare_highlight(ctx, text, _type)
+        if word is None:
+            return
         async with self.config.channel(channel).highlight() as highlight:
             if str(ctx.author.id) not in highlight:
                 highlight[f"{ctx.author.id}"] = {}
-            if text.lower() not in highlight[f"{ctx.author.id}"]:
-                highlight[f"{ctx.author.id}"][text.lower()] = {
+            if word not in highlight[f"{ctx.author.id}"]:
+                highlight[f"{ctx.author.id}"][word] = {
                     "toggle": True,
                     "bots": False,
                     "boundary": False,
+                    "type": _type,
                 }
                 await ctx.send(
                     f"The word `{text}` has been added to your highlight list for {channel}."
                 )
             else:
                 await ctx.send(f"The word {text} is already in your highlight list for {channel}.")
-        await self.generate_cache()
+        self.update_cache(channel.id, ctx.author.id, highlight.get(str(ctx.author.id)))
 
     @highlight.command()
     async def remove(self, ctx, channel: Optional[discord.TextChannel] = None, *, word: str):
@@ -203,7 +321,6 @@ class Highlight(commands.Cog):
 
         An optional channel can be provided to remove a highlight from that channel.
         """
-        word = word.lower()
         channel = channel or ctx.channel
         check = self.channel_check(ctx, channel)
         if not check:
@@ -213,6 +330,7 @@ class Highlight(commands.Cog):
             highlights = highlight.get(str(ctx.author.id))
             if not highlights:
                 return await ctx.send(f"You don't have any highlights setup in {channel}")
+            word = resolve_word(highlights, word)
             if word in highlight[f"{ctx.author.id}"]:
                 await ctx.send(
                     f"Highlighted word `{word}` has been removed from {channel} successfully."
@@ -221,7 +339,7 @@ class Highlight(commands.Cog):
 
             else:
                 await ctx.send("Your word is not currently setup in that channel..")
-        await self.generate_cache()
+        self.update_cache(channel.id, ctx.author.id, highlight.get(str(ctx.author.id)))
 
     @highlight.command()
     async def toggle(
@@ -248,13 +366,13 @@ class Highlight(commands.Cog):
                 await ctx.send("All your highlights have been enabled.")
             else:
                 await ctx.send("All your highlights have been disabled.")
-            await self.generate_cache()
+            self.update_cache(channel.id, ctx.author.id, highlight.get(str(ctx.author.id)))
             return
-        word = word.lower()
         async with self.config.channel(channel).highlight() as highlight:
             highlights = highlight.get(str(ctx.author.id))
             if not highlights:
                 return await ctx.send("You do not have any highlights setup.")
+            word = resolve_word(highlights, word)
             if word not in highlight[str(ctx.author.id)]:
                 return await ctx.send(
                     f"You do not have a highlight for `{word}` setup in {channel}"
@@ -264,7 +382,7 @@ class Highlight(commands.Cog):
                 await ctx.send(f"The highlight `{word}` has been enabled in {channel}.")
             else:
                 await ctx.send(f"The highlight `{word}` has been disabled in {channel}.")
-        await self.generate_cache()
+        self.update_cache(channel.id, ctx.author.id, highlight.get(str(ctx.author.id)))
 
     @highlight.command()
     async def bots(
@@ -304,17 +422,17 @@ class Highlight(commands.Cog):
                 else:
                     await ctx.send("Bots will no longer trigger on any of your highlights.")
 
-                await self.generate_cache()
+                self.update_cache(channel.id, ctx.author.id, highlight.get(str(ctx.author.id)))
                 return
 
             else:
                 await ctx.send("Cancelling.")
                 return
-        word = word.lower()
         async with self.config.channel(channel).highlight() as highlight:
             highlights = highlight.get(str(ctx.author.id))
             if not highlights:
                 return await ctx.send("You do not have any highlights setup.")
+            word = resolve_word(highlights, word)
             if word not in highlight[str(ctx.author.id)]:
                 return await ctx.send(
                     f"You do not have a highlight for `{word}` setup in {channel}"
@@ -329,7 +447,7 @@ class Highlight(commands.Cog):
                     f"The highlight `{word}` will no longer be trigged by bots in {channel}."
                 )
 
-        await self.generate_cache()
+        self.update_cache(channel.id, ctx.author.id, highlight.get(str(ctx.author.id)))
 
     @highlight.command(name="list")
     async def _list(self, ctx, channel: Optional[discord.TextChannel] = None):
@@ -350,6 +468,7 @@ class Highlight(commands.Cog):
                     on_or_off(highlight[f"{ctx.author.id}"][word]["toggle"]),
                     yes_or_no(not highlight[f"{ctx.author.id}"][word]["bots"]),
                     on_or_off(highlight[f"{ctx.author.id}"][word].get("boundary", False)),
+                    highlight[f"{ctx.author.id}"][word].get("type", "word").capitalize(),
                 ]
                 for word in highlight[f"{ctx.author.id}"]
             ]
@@ -359,7 +478,7 @@ class Highlight(commands.Cog):
                 description=box(
                     tabulate.tabulate(
                         sorted(words, key=lambda x: x[1], reverse=True),
-                        headers=["Word", "Toggle", "Ignoring Bots", "Word Boundaries"],
+                        headers=["Word", "Toggle", "Ignoring Bots", "Word Boundaries", "Type"],
                     ),
                     lang="prolog",
                 ),
@@ -407,17 +526,17 @@ class Highlight(commands.Cog):
                 else:
                     await ctx.send("None of your highlights will use word boundaries.")
 
-                await self.generate_cache()
+                self.update_cache(channel.id, ctx.author.id, highlight.get(str(ctx.author.id)))
                 return
 
             else:
                 await ctx.send("Cancelling.")
                 return
-        word = word.lower()
         async with self.config.channel(channel).highlight() as highlight:
             highlights = highlight.get(str(ctx.author.id))
             if not highlights:
                 return await ctx.send("You do not have any highlights setup.")
+            word = resolve_word(highlights, word)
             if word not in highlight[str(ctx.author.id)]:
                 return await ctx.send(
                     f"You do not have a highlight for `{word}` setup in {channel}"
@@ -432,7 +551,203 @@ class Highlight(commands.Cog):
                     f"The highlight `{word}` will no longer use word boundaries in {channel}."
                 )
 
-        await self.generate_cache()
+        self.update_cache(channel.id, ctx.author.id, highlight.get(str(ctx.author.id)))
+
+    @highlight.group(name="guild")
+    async def _guild(self, ctx):
+        """Guild-wide highlighting commands.
+
+        Guild highlights apply to every channel in this server that you can read.
+        """
+
+    @_guild.command(name="add")
+    async def guild_add(self, ctx, _type: Optional[HighlightType] = "word", *, text: str):
+        """Add a word to be highlighted on across the whole server.
+
+        Text will be converted to lowercase.
+        The type can be `--word` (default), `--regex` or `--wildcard`.
+        """
+        word = await self.prepare_highlight(ctx, text, _type)
+        if word is None:
+            return
+        async with self.config.guild(ctx.guild).highlight() as highlight:
+            if str(ctx.author.id) not in highlight:
+                highlight[f"{ctx.author.id}"] = {}
+            if word not in highlight[f"{ctx.author.id}"]:
+                highlight[f"{ctx.author.id}"][word] = {
+                    "toggle": True,
+                    "bots": False,
+                    "boundary": False,
+                    "type": _type,
+                }
+                await ctx.send(
+                    f"The word `{text}` has been added to your highlight list for {ctx.guild}."
+                )
+            else:
+                await ctx.send(
+                    f"The word {text} is already in your highlight list for {ctx.guild}."
+                )
+        self.update_cache(
+            ctx.guild.id, ctx.author.id, highlight.get(str(ctx.author.id)), scope="guild"
+        )
+
+    @_guild.command(name="remove")
+    async def guild_remove(self, ctx, *, word: str):
+        """Remove a server-wide highlight."""
+        async with self.config.guild(ctx.guild).highlight() as highlight:
+            highlights = highlight.get(str(ctx.author.id))
+            if not highlights:
+                return await ctx.send(f"You don't have any highlights setup in {ctx.guild}")
+            word = resolve_word(highlights, word)
+            if word in highlight[f"{ctx.author.id}"]:
+                await ctx.send(
+                    f"Highlighted word `{word}` has been removed from {ctx.guild} successfully."
+                )
+                del highlight[f"{ctx.author.id}"][word]
+            else:
+                await ctx.send("Your word is not currently setup in this server.")
+        self.update_cache(
+            ctx.guild.id, ctx.author.id, highlight.get(str(ctx.author.id)), scope="guild"
+        )
+
+    @_guild.command(name="list")
+    async def guild_list(self, ctx):
+        """Current server-wide highlight settings."""
+        highlight = await self.config.guild(ctx.guild).highlight()
+        if str(ctx.author.id) in highlight and highlight[f"{ctx.author.id}"]:
+            words = [
+                [
+                    word,
+                    on_or_off(highlight[f"{ctx.author.id}"][word]["toggle"]),
+                    yes_or_no(not highlight[f"{ctx.author.id}"][word]["bots"]),
+                    on_or_off(highlight[f"{ctx.author.id}"][word].get("boundary", False)),
+                    highlight[f"{ctx.author.id}"][word].get("type", "word").capitalize(),
+                ]
+                for word in highlight[f"{ctx.author.id}"]
+            ]
+            embed = discord.Embed(
+                title=f"Current highlighted text for {ctx.author.display_name} in {ctx.guild}:",
+                colour=ctx.author.colour,
+                description=box(
+                    tabulate.tabulate(
+                        sorted(words, key=lambda x: x[1], reverse=True),
+                        headers=["Word", "Toggle", "Ignoring Bots", "Word Boundaries", "Type"],
+                    ),
+                    lang="prolog",
+                ),
+            )
+            await ctx.send(embed=embed)
+        else:
+            await ctx.send(
+                f"You currently do not have any highlighted words set up in {ctx.guild}."
+            )
+
+    @_guild.command(name="toggle")
+    async def guild_toggle(self, ctx, state: bool, *, word: str = None):
+        """Toggle server-wide highlighting.
+
+        Not passing a word will enable/disable all of your server-wide highlights.
+        """
+        await self.guild_setting(ctx, "toggle", state, word)
+
+    @_guild.command(name="bots")
+    async def guild_bots(self, ctx, state: bool, *, word: str = None):
+        """Enable server-wide highlighting of bot messages.
+
+        Not passing a word will apply to all of your server-wide highlights.
+        """
+        await self.guild_setting(ctx, "bots", state, word)
+
+    @_guild.command(name="boundary")
+    async def guild_boundary(self, ctx, state: bool, *, word: str = None):
+        """Use word boundaries for server-wide highlighting.
+
+        Not passing a word will apply to all of your server-wide highlights.
+        """
+        await self.guild_setting(ctx, "boundary", state, word)
+
+    async def guild_setting(self, ctx, setting: str, state: bool, word: Optional[str]):
+        async with self.config.guild(ctx.guild).highlight() as highlight:
+            highlights = highlight.get(str(ctx.author.id))
+            if not highlights:
+                return await ctx.send("You do not have any highlights setup.")
+            if word is None:
+                words = list(highlights)
+                target = "all your server-wide highlights"
+            else:
+                word = resolve_word(highlights, word)
+                if word not in highlights:
+                    return await ctx.send(
+                        f"You do not have a highlight for `{word}` setup in {ctx.guild}"
+                    )
+                words = [word]
+                target = f"the highlight `{word}`"
+            for word in words:
+                highlights[word][setting] = state
+        self.update_cache(ctx.guild.id, ctx.author.id, highlights, scope="guild")
+        await ctx.send(
+            f"`{setting.capitalize()}` has been {'enabled' if state else 'disabled'} for {target} in {ctx.guild}."
+        )
+
+    @commands.is_owner()
+    @highlight.command(hidden=True)
+    async def stats(self, ctx):
+        """Highlight delivery queue statistics."""
+        stats = self.delivery.stats()
+        rows = [
+            ["Queued messages", stats["queued"]],
+            ["Pending highlights", stats["pending"]],
+            ["DMs delivered", stats["delivered"]],
+            ["Highlights coalesced", stats["coalesced"]],
+            ["DMs failed", stats["failed"]],
+            ["Latency p50", f"{stats['p50']:.2f}s"],
+            ["Latency p99", f"{stats['p99']:.2f}s"],
+        ]
+        await ctx.send(box(tabulate.tabulate(rows), lang="prolog"))
+
+    @commands.is_owner()
+    @commands.group()
+    async def highlightset(self, ctx):
+        """Settings for highlight."""
+
+    @highlightset.command()
+    async def cooldown(self, ctx, *, length: TimedeltaConverter):
+        """How long to wait before highlighting a user in the same channel again.
+
+        Use `0s` to disable the cooldown.
+        """
+        duration_seconds = length.total_seconds()
+        await self.config.cooldown.set(duration_seconds)
+        self.cooldowns.configure(cooldown=duration_seconds)
+        if duration_seconds:
+            await ctx.send(
+                f"Users will be highlighted at most once every {humanize_timedelta(seconds=duration_seconds)} per channel."
+            )
+        else:
+            await ctx.send("The highlight cooldown has been disabled.")
+
+    @highlightset.command()
+    async def activity(self, ctx, *, length: TimedeltaConverter):
+        """How long after speaking in a channel a user won't be highlighted there.
+
+        Use `0s` to always highlight users, even if they are active in the channel.
+        """
+        duration_seconds = length.total_seconds()
+        await self.config.activity.set(duration_seconds)
+        self.cooldowns.configure(activity=duration_seconds)
+        if duration_seconds:
+            await ctx.send(
+                f"Users will not be highlighted in channels they have spoken in during the last {humanize_timedelta(seconds=duration_seconds)}."
+            )
+        else:
+            await ctx.send("Users will now be highlighted regardless of their recent activity.")
+
+
+def resolve_word(highlights, word):
+    """Find the stored key for a word, regex patterns are stored with their case intact."""
+    if word in highlights:
+        return word
+    return word.lower()
 
 
 def yes_or_no(boolean):
@@ -0,0 +1,281 @@
+import logging
+import re
+import time
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Pattern, Tuple
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+logger = logging.getLogger("red.flare.highlight.matcher")
+
+HIGHLIGHT_TYPES = ("word", "regex", "wildcard")
+# Longest time, in seconds, a regex or wildcard highlight may take to scan a probe message.
+# Highlights are matched on the event loop, so this is kept to a few milliseconds.
+PATTERN_BUDGET = 0.005
+BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=")
+PROBES = ("a", "a1", "a ", " a", "!", "a!", "1", "ab", "a b", "aa!")
+REPEATS = {
+    op
+    for op in (
+        getattr(sre_parse, name, None)
+        for name in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT")
+    )
+    if op is not None
+}
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+def _at_boundary(text: str, index: int) -> bool:
+    """Mirror the semantics of ``\\b`` at the gap before ``text[index]``."""
+    left = index > 0 and _is_word_char(text[index - 1])
+    right = index < len(text) and _is_word_char(text[index])
+    return left != right
+
+
+def translate_wildcard(pattern: str) -> str:
+    """Translate a wildcard highlight into a regex.
+
+    ``*`` matches any run of non-whitespace characters and ``?`` matches a single one.
+    Repeated ``*`` are collapsed into one.
+    """
+    pattern = re.sub(r"\*+", "*", pattern)
+    # Anchoring a leading wildcard to the start of a run of non-whitespace means each
+    # run is only scanned once, rather than once from every character in it.
+    parts = [r"(?<!\S)"] if pattern.startswith(("*", "?")) else []
+    for char in pattern:
+        if char == "*":
+            parts.append(r"\S*")
+        elif char == "?":
+            parts.append(r"\S")
+        else:
+            parts.append(re.escape(char))
+    return "".join(parts)
+
+
+def _subpatterns(value) -> Iterator["sre_parse.SubPattern"]:
+    if isinstance(value, sre_parse.SubPattern):
+        yield value
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _subpatterns(item)
+
+
+def _check_repeats(pattern: "sre_parse.SubPattern"):
+    """Reject the shapes which backtrack catastrophically.
+
+    A repeated group may not contain an unbounded repeat, as in ``(a+)+`` or
+    ``(a+){2,9}``, and an unbounded repeat may not contain any repeat or alternation,
+    as in ``((ab)+)+`` or ``(a|ab)*``.
+    """
+    for op, value in pattern:
+        if op in REPEATS and value[1] > 1:
+            for body in _subpatterns(value[2]):
+                _check_body(body, value[1] == sre_parse.MAXREPEAT)
+        for inner in _subpatterns(value):
+            _check_repeats(inner)
+
+
+def _check_body(pattern: "sre_parse.SubPattern", unbounded: bool):
+    for op, value in pattern:
+        if op in REPEATS and value[1] > 1 and (unbounded or value[1] == sre_parse.MAXREPEAT):
+            raise re.error("nested repeats are not supported")
+        if op == sre_parse.BRANCH and unbounded:
+            raise re.error("repeated alternations are not supported")
+        for inner in _subpatterns(value):
+            _check_body(inner, unbounded)
+
+
+def compile_pattern(word: str, settings: dict) -> Pattern:
+    """Compile a regex or wildcard highlight, raising ``re.error`` if it is invalid."""
+    if settings.get("type") == "wildcard":
+        pattern = translate_wildcard(word)
+    else:
+        if BACKREFERENCE.search(word):
+            raise re.error("backreferences are not supported")
+        _check_repeats(sre_parse.parse(word))
+        pattern = word
+    if settings.get("boundary", False):
+        pattern = rf"\b(?:{pattern})\b"
+    return re.compile(pattern, flags=re.I)
+
+
+def pattern_cost(pattern: Pattern) -> float:
+    """Return the worst time, in seconds, a pattern took to scan any probe message.
+
+    Probes grow slowly at first and then geometrically, stopping as soon as the
+    budget is exceeded so catastrophic backtracking is caught before it runs away.
+    This is blocking and should be run in an executor.
+    """
+    probes = list(PROBES)
+    probes.extend(sorted({char for char in pattern.pattern.lower() if char.isalnum()})[:10])
+    # Runs of literals catch patterns which only backtrack on a multi-character repeat.
+    probes.extend(sorted(set(re.findall(r"[a-z0-9]{2,4}", pattern.pattern.lower())))[:10])
+    lengths = list(range(2, 32, 2)) + [32, 64, 128, 256, 512, 1024, 2000]
+    worst = 0.0
+    for probe in probes:
+        for length in lengths:
+            text = (probe * length)[:length] + "\x00"
+            start = time.perf_counter()
+            pattern.search(text)
+            elapsed = time.perf_counter() - start
+            worst = max(worst, elapsed)
+            if elapsed > PATTERN_BUDGET:
+                return worst
+    return worst
+
+
+class HighlightMatcher:
+    """Aho-Corasick automaton over every enabled highlight in a channel.
+
+    Built once from a channel's ``highlight`` config ({user: {word: settings}}) and
+    then used to find all highlighted words, and who owns them, in a single pass
+    over the lowercased message content. Regex and wildcard highlights are joined
+    into one alternation that is only checked pattern by pattern when it matches.
+    """
+
+    __slots__ = ("_goto", "_fail", "_output", "_keywords", "_patterns", "_combined")
+
+    def __init__(self, highlights: Dict[str, Dict[str, dict]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._output: List[List[int]] = [[]]
+        self._fail: List[int] = [0]
+        # Each keyword is (word, [(user, boundary, settings), ...]).
+        self._keywords: List[Tuple[str, List[Tuple[str, bool, dict]]]] = []
+        # Each pattern is (compiled, [(user, word, settings), ...]).
+        self._patterns: List[Tuple[Pattern, List[Tuple[str, str, dict]]]] = []
+        self._combined: Optional[Pattern] = None
+        index = {}
+        patterns = {}
+        for user, words in highlights.items():
+            for word, settings in words.items():
+                if not settings.get("toggle", True):
+                    continue
+                if settings.get("type", "word") != "word":
+                    self._add_pattern(patterns, user, word, settings)
+                    continue
+                word = word.lower()
+                if not word:
+                    continue
+                if word not in index:
+                    index[word] = len(self._keywords)
+                    self._keywords.append((word, []))
+                    self._insert(word, index[word])
+                self._keywords[index[word]][1].append(
+                    (user, settings.get("boundary", False), settings)
+                )
+        self._build_failure_links()
+        if self._patterns:
+            try:
+                self._combined = re.compile(
+                    "|".join(f"(?:{compiled.pattern})" for compiled, _ in self._patterns),
+                    flags=re.I,
+                )
+            except re.error:
+                self._combined = None
+
+    def __bool__(self):
+        return bool(self._keywords or self._patterns)
+
+    def _add_pattern(self, patterns: dict, user: str, word: str, settings: dict):
+        try:
+            compiled = compile_pattern(word, settings)
+        except re.error as exc:
+            logger.debug(f"Skipping invalid highlight pattern {word!r}: {exc}")
+            return
+        if compiled.pattern not in patterns:
+            patterns[compiled.pattern] = len(self._patterns)
+            self._patterns.append((compiled, []))
+        self._patterns[patterns[compiled.pattern]][1].append((user, word, settings))
+
+    def _insert(self, word: str, keyword: int):
+        node = 0
+        for char in word:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._output.append([])
+                self._fail.append(0)
+            node = nxt
+        self._output[node].append(keyword)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child].extend(self._output[self._fail[child]])
+
+    def find(self, content: str) -> Dict[str, List[Tuple[str, dict]]]:
+        """Return ``{user: [(word, settings), ...]}`` for every highlight in ``content``.
+
+        ``content`` is expected to already be lowercased.
+        """
+        matches: Dict[str, List[Tuple[str, dict]]] = {}
+        seen = set()
+        goto, fail, output, keywords = self._goto, self._fail, self._output, self._keywords
+        node = 0
+        for position, char in enumerate(content):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for keyword in output[node]:
+                word, owners = keywords[keyword]
+                bounded = None
+                for user, boundary, settings in owners:
+                    if (user, word) in seen:
+                        continue
+                    if boundary:
+                        if bounded is None:
+                            start = position - len(word) + 1
+                            bounded = _at_boundary(content, start) and _at_boundary(
+                                content, position + 1
+                            )
+                        if not bounded:
+                            continue
+                    seen.add((user, word))
+                    matches.setdefault(user, []).append((word, settings))
+        if self._patterns and (self._combined is None or self._combined.search(content)):
+            for compiled, owners in self._patterns:
+                if not compiled.search(content):
+                    continue
+                for user, word, settings in owners:
+                    if (user, word) not in seen:
+                        seen.add((user, word))
+                        matches.setdefault(user, []).append((word, settings))
+        return matches
+
+
+def find_highlights(
+    matchers: List[HighlightMatcher], content: str, author_id: int, *, bot: bool = False
+) -> Dict[str, List[str]]:
+    """Run every matcher over a message, as ``on_message`` does.
+
+    Returns ``{user: [word, ...]}`` without the author, words which don't trigger on
+    bots when ``bot`` is set, or words highlighted in more than one scope twice.
+    """
+    content = content.lower()
+    matches: Dict[str, List[str]] = {}
+    for matcher in matchers:
+        for user, words in matcher.find(content).items():
+            if int(user) == author_id:
+                continue
+            for word, settings in words:
+                if bot and not settings["bots"]:
+                    continue
+                highlighted = matches.setdefault(user, [])
+                if word not in highlighted:
+                    highlighted.append(word)
+    return matches
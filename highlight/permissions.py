@@ -0,0 +1,30 @@
+from typing import Dict
+
+
+class PermissionCache:
+    """Cache of whether a member can read a channel, grouped per guild and member.
+
+    Entries are dropped by the cog's listeners whenever a channel's overwrites, a
+    member's roles or a guild's roles change.
+    """
+
+    def __init__(self):
+        # guild id -> member id -> channel id -> can read
+        self._cache: Dict[int, Dict[int, Dict[int, bool]]] = {}
+
+    def can_read(self, channel, member) -> bool:
+        channels = self._cache.setdefault(channel.guild.id, {}).setdefault(member.id, {})
+        readable = channels.get(channel.id)
+        if readable is None:
+            readable = channels[channel.id] = channel.permissions_for(member).read_messages
+        return readable
+
+    def invalidate_guild(self, guild_id: int):
+        self._cache.pop(guild_id, None)
+
+    def invalidate_member(self, guild_id: int, member_id: int):
+        self._cache.get(guild_id, {}).pop(member_id, None)
+
+    def invalidate_channel(self, guild_id: int, channel_id: int):
+        for channels in self._cache.get(guild_id, {}).values():
+            channels.pop(channel_id, None)
@@ -15,12 +15,14 @@ from redbot.core.utils.chat_formatting import box, humanize_timedelta, pagify
 log = logging.getLogger("red.flare.redditpost")
 
 REDDIT_LOGO = "https://www.redditinc.com/assets/images/site/reddit-logo.png"
+# Feeds fetched at the same time while checking for new posts.
+MAX_CONCURRENT_FETCHES = 10
 
 
 class RedditPost(commands.Cog):
     """A reddit auto posting cog."""
 
-    __version__ = "0.1.6"
+    __version__ = "0.2.0"
 
     def format_help_for_context(self, ctx):
         """Thanks Sinbad."""
@@ -35,6 +37,9 @@ class RedditPost(commands.Cog):
         self.session = aiohttp.ClientSession()
         self.bg_loop_task: Optional[asyncio.Task] = None
         self.notified = False
+        # ETag and Last-Modified validators of each feed, sent with the next request.
+        self.feed_validators = {}
+        self.pending_validators = {}
 
     async def red_get_data_for_user(self, *, user_id: int):
         # this cog does not story any data
@@ -67,24 +72,33 @@ class RedditPost(commands.Cog):
                     self.notified = True
 
     async def do_feeds(self):
-        feeds = {}
         channel_data = await self.config.all_channels()
+        subscriptions = []
         for channel_id, data in channel_data.items():
-
             channel = self.bot.get_channel(channel_id)
             if not channel:
                 continue
             for sub, feed in data["reddits"].items():
                 url = feed.get("url", None)
-                if not url:
-                    continue
-                if url in feeds:
-                    response = feeds[url]
-                else:
-                    response = await self.fetch_feed(url)
-                    feeds[url] = response
-                if response is None:
-                    continue
+                if url:
+                    subscriptions.append((channel, sub, feed, url))
+
+        urls = {url for _, _, _, url in subscriptions}
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_FETCHES)
+
+        async def fetch(url):
+            async with semaphore:
+                return url, await self.fetch_feed(url, conditional=True)
+
+        self.pending_validators = {}
+        feeds = dict(await asyncio.gather(*(fetch(url) for url in urls)))
+
+        failed = set()
+        for channel, sub, feed, url in subscriptions:
+            response = feeds[url]
+            if response is None:
+                continue
+            try:
                 time = await self.format_send(
                     response,
                     channel,
@@ -94,8 +108,22 @@ class RedditPost(commands.Cog):
                     feed.get("logo", REDDIT_LOGO),
                 )
                 if time is not None:
-                    async with self.config.channel(channel).reddits() as feeds:
-                        feeds[sub]["last_post"] = time
+                    async with self.config.channel(channel).reddits() as reddits:
+                        reddits[sub]["last_post"] = time
+            except Exception as exc:
+                log.error(f"Exception while posting r/{sub} to {channel.id}: ", exc_info=exc)
+                failed.add(url)
+
+        # Feeds are only treated as seen once every channel was sent their posts, so a
+        # failed channel gets the full feed again on the next loop instead of a 304.
+        for url in set(self.feed_validators) - urls:
+            del self.feed_validators[url]
+        for url, (etag, last_modified) in self.pending_validators.items():
+            if url in failed or not (etag or last_modified):
+                self.feed_validators.pop(url, None)
+            else:
+                self.feed_validators[url] = (etag, last_modified)
+        self.pending_validators = {}
 
     @commands.admin_or_permissions(manage_channels=True)
     @commands.guild_only()
@@ -260,14 +288,30 @@ class RedditPost(commands.Cog):
 
         await ctx.tick()
 
-    async def fetch_feed(self, url: str):
+    async def fetch_feed(self, url: str, *, conditional: bool = False):
+        """Fetch the posts of a feed.
+
+        Conditional requests send the validators from the feed's last successful
+        delivery, and return None without downloading the feed if it hasn't changed
+        since. Their new validators are kept in ``pending_validators`` until every
+        channel has been sent the posts.
+        """
         timeout = aiohttp.client.ClientTimeout(total=15)
+        headers = {}
+        if conditional and url in self.feed_validators:
+            etag, last_modified = self.feed_validators[url]
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
         try:
-            async with self.session.get(url, timeout=timeout) as response:
+            async with self.session.get(url, timeout=timeout, headers=headers) as response:
                 if response.status == 200:
                     data = await response.json()
                 else:
                     return None
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
         except (aiohttp.ClientError, asyncio.TimeoutError):
             return None
         except Exception as exc:
@@ -276,6 +320,8 @@ class RedditPost(commands.Cog):
                 exc_info=exc,
             )
             return None
+        if conditional:
+            self.pending_validators[url] = (etag, last_modified)
         if data["data"]["dist"] > 0:
             return data["data"]["children"]
         return None
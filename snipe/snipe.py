@@ -6,6 +6,9 @@ from typing import Optional
 import discord
 from redbot.core import Config, checks, commands
 from redbot.core.commands.converter import TimedeltaConverter
+from redbot.core.utils.chat_formatting import humanize_timedelta, pagify
+
+from .store import MAX_SNIPES, SnipeEntry, SnipeStore
 
 log = logging.getLogger("red.flare.snipe")
 
@@ -13,7 +16,7 @@ log = logging.getLogger("red.flare.snipe")
 class Snipe(commands.Cog):
     """Snipe the last message from a server."""
 
-    __version__ = "0.1.0"
+    __version__ = "0.3.0"
 
     def format_help_for_context(self, ctx):
         """Thanks Sinbad."""
@@ -26,7 +29,8 @@ class Snipe(commands.Cog):
         self.config.register_guild(**defaults_guild)
         self.config.register_global(timer=60)
         self.bot = bot
-        self.cache = {}
+        self.cache = SnipeStore()
+        self.timer = 60
         self.snipe_loop_task: Optional[asyncio.Task] = None
 
     async def red_get_data_for_user(self, *, user_id: int):
@@ -49,22 +53,15 @@ class Snipe(commands.Cog):
         await self.bot.wait_until_ready()
         while True:
             try:
-                to_delete = []
-                for guild in self.cache:
-                    for channel in self.cache[guild]:
-                        if datetime.utcnow() - self.cache[guild][channel]["timestamp"] > timedelta(
-                            seconds=self.config_cache[guild]["timeout"]
-                        ):
-                            to_delete.append([guild, channel])
-                for entry in to_delete:
-                    del self.cache[entry[0]][entry[1]]
-                await asyncio.sleep(await self.config.timer())
+                self.cache.expire()
+                await asyncio.sleep(self.timer)
             except Exception as exc:
                 log.error("Exception occured in snipe loop: ", exc_info=exc)
                 break
 
     async def generate_cache(self):
         self.config_cache = await self.config.all_guilds()
+        self.timer = await self.config.timer()
 
     @commands.Cog.listener()
     async def on_raw_message_delete(self, payload):
@@ -86,59 +83,165 @@ class Snipe(commands.Cog):
             return
         self.add_cache_entry(message, guild_id, payload.channel_id)
 
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload):
+        guild_id = payload.guild_id
+        if guild_id is None:
+            return
+        config = self.config_cache.get(guild_id)
+        if not config or not config["toggle"]:
+            return
+        messages = sorted(
+            (message for message in payload.cached_messages if not message.author.bot),
+            key=lambda message: message.id,
+        )
+        timeout = config["timeout"]
+        self.cache.add_many(
+            guild_id,
+            payload.channel_id,
+            [SnipeEntry(message, timeout) for message in messages[-MAX_SNIPES:]],
+        )
+        log.debug(
+            f"Added {min(len(messages), MAX_SNIPES)} of {len(payload.message_ids)} purged messages to the snipe cache. Guild ID: {guild_id} | Channel ID: {payload.channel_id}"
+        )
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload):
+        message = payload.cached_message
+        if message is None or message.guild is None or message.author.bot:
+            return
+        config = self.config_cache.get(message.guild.id)
+        if not config or not config["toggle"]:
+            return
+        after = payload.data.get("content")
+        # Embeds being resolved for links also fire edits without changing the content.
+        if after is None or after == message.content:
+            return
+        entry = SnipeEntry(message, config["timeout"], edited=after)
+        self.cache.add(message.guild.id, message.channel.id, entry, "edited")
+
     def add_cache_entry(self, message, guild, channel):
-        if guild not in self.cache:
-            self.cache[guild] = {}
-        self.cache[guild][channel] = {
-            "content": message.content,
-            "author": message.author.id,
-            "timestamp": message.created_at,
-        }
+        entry = SnipeEntry(message, self.config_cache[guild]["timeout"])
+        self.cache.add(guild, channel, entry)
 
-    @commands.cooldown(rate=1, per=5, type=commands.BucketType.channel)
-    @commands.command()
-    async def snipe(self, ctx, channel: Optional[discord.TextChannel] = None):
-        """Shows the last deleted message from a specified channel."""
-        channel = channel or ctx.channel
+    async def get_snipes(self, ctx, channel, kind="deleted"):
         if not await self.config.guild(ctx.guild).toggle():
             await ctx.send(
                 f"Sniping is not allowed in this server! An admin may turn it on by typing the `{ctx.clean_prefix}snipeset enable` command."
             )
-            return
-        guildcache = self.cache.get(ctx.guild.id, None)
-        if guildcache is None:
-            await ctx.send("There's nothing to snipe!")
-            return
-        channelsnipe = guildcache.get(channel.id, None)
-        if channelsnipe is None:
+            return None
+        snipes = self.cache.get(ctx.guild.id, channel.id, kind)
+        if not snipes:
             await ctx.send("There's nothing to snipe!")
+            return None
+        return snipes
+
+    @commands.guild_only()
+    @commands.cooldown(rate=1, per=5, type=commands.BucketType.channel)
+    @commands.group(invoke_without_command=True)
+    async def snipe(
+        self, ctx, index: Optional[int] = 1, channel: Optional[discord.TextChannel] = None
+    ):
+        """Shows a recently deleted message from a specified channel.
+
+        The index counts back from the most recently deleted message, use `[p]snipe list`
+        to see them all.
+        """
+        channel = channel or ctx.channel
+        snipes = await self.get_snipes(ctx, channel)
+        if snipes is None:
             return
-        if datetime.utcnow() - channelsnipe["timestamp"] > timedelta(
-            seconds=await self.config.guild(ctx.guild).timeout()
-        ):
-            del self.cache[ctx.guild.id][channel.id]
-            await ctx.send("There's nothing to snipe!")
+        if not 1 <= index <= len(snipes):
+            await ctx.send(f"There are only {len(snipes)} messages to snipe in {channel.mention}.")
             return
-        del self.cache[ctx.guild.id][channel.id]
-        author = ctx.guild.get_member(channelsnipe["author"])
-        if not channelsnipe["content"]:
+        await ctx.send(embed=self.snipe_embed(ctx, snipes[index - 1]))
+
+    def snipe_embed(self, ctx, channelsnipe):
+        author = ctx.guild.get_member(channelsnipe.author)
+        if not channelsnipe.content:
             embed = discord.Embed(
                 description="No message content.\nThe deleted message may have been an image or an embed.",
-                timestamp=channelsnipe["timestamp"],
+                timestamp=channelsnipe.created_at,
                 color=ctx.author.color,
             )
         else:
             embed = discord.Embed(
-                description=channelsnipe["content"],
-                timestamp=channelsnipe["timestamp"],
+                description=channelsnipe.content,
+                timestamp=channelsnipe.created_at,
                 color=ctx.author.color,
             )
+        if channelsnipe.edited is not None:
+            embed.add_field(
+                name="After", value=channelsnipe.edited[:1024] or "\u200b", inline=False
+            )
+        if channelsnipe.attachments:
+            embed.add_field(
+                name="Attachments",
+                value="\n".join(channelsnipe.attachments)[:1024],
+                inline=False,
+            )
+        if channelsnipe.embeds:
+            embed.add_field(
+                name="Embeds", value="\n".join(channelsnipe.embeds)[:1024], inline=False
+            )
         embed.set_footer(text=f"Sniped by: {str(ctx.author)}")
         if author is None:
             embed.set_author(name="Removed Member")
         else:
             embed.set_author(name=f"{author} ({author.id})", icon_url=author.avatar_url)
-        await ctx.send(embed=embed)
+        return embed
+
+    @commands.cooldown(rate=1, per=5, type=commands.BucketType.channel)
+    @snipe.command(name="list")
+    async def _list(self, ctx, channel: Optional[discord.TextChannel] = None):
+        """List the recently deleted messages from a specified channel."""
+        await self.send_list(ctx, channel or ctx.channel, "deleted")
+
+    async def send_list(self, ctx, channel, kind):
+        snipes = await self.get_snipes(ctx, channel, kind)
+        if snipes is None:
+            return
+        now = datetime.utcnow()
+        msg = []
+        for index, entry in enumerate(snipes, 1):
+            author = ctx.guild.get_member(entry.author) or "Removed Member"
+            content = entry.content or (
+                "[Attachment]" if entry.attachments else "[Embed]" if entry.embeds else ""
+            )
+            if len(content) > 50:
+                content = content[:47] + "..."
+            ago = humanize_timedelta(timedelta=now - entry.sniped_at)
+            ago = f"{ago} ago" if ago else "just now"
+            msg.append(f"**{index}.** {author}, {ago}: {discord.utils.escape_markdown(content)}")
+        for page in pagify("\n".join(msg)):
+            # Deleted content is replayed as plain text, so it must not ping anyone again.
+            await ctx.send(page, allowed_mentions=discord.AllowedMentions.none())
+
+    @commands.guild_only()
+    @commands.cooldown(rate=1, per=5, type=commands.BucketType.channel)
+    @commands.group(invoke_without_command=True)
+    async def editsnipe(
+        self, ctx, index: Optional[int] = 1, channel: Optional[discord.TextChannel] = None
+    ):
+        """Shows a recently edited message from a specified channel.
+
+        The index counts back from the most recently edited message, use `[p]editsnipe list`
+        to see them all.
+        """
+        channel = channel or ctx.channel
+        snipes = await self.get_snipes(ctx, channel, "edited")
+        if snipes is None:
+            return
+        if not 1 <= index <= len(snipes):
+            await ctx.send(f"There are only {len(snipes)} edits to snipe in {channel.mention}.")
+            return
+        await ctx.send(embed=self.snipe_embed(ctx, snipes[index - 1]))
+
+    @commands.cooldown(rate=1, per=5, type=commands.BucketType.channel)
+    @editsnipe.command(name="list")
+    async def editsnipe_list(self, ctx, channel: Optional[discord.TextChannel] = None):
+        """List the recently edited messages from a specified channel."""
+        await self.send_list(ctx, channel or ctx.channel, "edited")
 
     @checks.admin_or_permissions(manage_guild=True)
     @commands.group()
@@ -202,4 +305,5 @@ class Snipe(commands.Cog):
         """
         duration = time.total_seconds()
         await self.config.timer.set(duration)
+        self.timer = duration
         await ctx.tick()
@@ -0,0 +1,128 @@
+import heapq
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+
+import discord
+
+# Deleted and edited messages remembered per channel, each.
+MAX_SNIPES = 10
+# Length embed descriptions are shortened to when summarised.
+EMBED_SUMMARY = 200
+
+
+def summarise_embed(embed: discord.Embed) -> str:
+    # Unset fields are Embed.Empty, which is falsy.
+    summary = " - ".join(part for part in (embed.title, embed.description) if part)
+    summary = summary or "Untitled embed"
+    if len(summary) > EMBED_SUMMARY:
+        summary = summary[: EMBED_SUMMARY - 3] + "..."
+    return summary
+
+
+class SnipeEntry:
+    """A deleted or edited message, trimmed down to what is shown when it is sniped.
+
+    For edits ``content`` holds the message before it was edited and ``edited`` after.
+    """
+
+    __slots__ = (
+        "content",
+        "edited",
+        "author",
+        "created_at",
+        "sniped_at",
+        "deadline",
+        "attachments",
+        "embeds",
+    )
+
+    def __init__(self, message: discord.Message, timeout: float, edited: Optional[str] = None):
+        self.content = message.content
+        self.edited = edited
+        self.author = message.author.id
+        self.created_at = message.created_at
+        self.sniped_at = datetime.utcnow()
+        self.deadline = time.monotonic() + timeout
+        if edited is None:
+            self.attachments = tuple(attachment.url for attachment in message.attachments)
+            self.embeds = tuple(summarise_embed(embed) for embed in message.embeds)
+        else:
+            self.attachments = self.embeds = ()
+
+
+class ChannelSnipes:
+    __slots__ = ("deleted", "edited")
+
+    def __init__(self):
+        self.deleted: Deque[SnipeEntry] = deque(maxlen=MAX_SNIPES)
+        self.edited: Deque[SnipeEntry] = deque(maxlen=MAX_SNIPES)
+
+    def __bool__(self):
+        return bool(self.deleted or self.edited)
+
+
+class SnipeStore:
+    """Bounded history of deleted and edited messages per channel.
+
+    Each channel keeps a ring of its last ``MAX_SNIPES`` deletions and edits, and a
+    heap of ``(deadline, guild, channel, kind)`` tracks when each entry expires, so
+    expiring only touches the entries which have expired.
+    """
+
+    def __init__(self):
+        self.channels: Dict[int, Dict[int, ChannelSnipes]] = {}
+        self.expiries: List[Tuple[float, int, int, str]] = []
+
+    def add(self, guild: int, channel: int, entry: SnipeEntry, kind: str = "deleted"):
+        channels = self.channels.setdefault(guild, {})
+        snipes = channels.get(channel)
+        if snipes is None:
+            snipes = channels[channel] = ChannelSnipes()
+        getattr(snipes, kind).append(entry)
+        heapq.heappush(self.expiries, (entry.deadline, guild, channel, kind))
+
+    def add_many(self, guild: int, channel: int, entries: List[SnipeEntry]):
+        """Add deletions from a single purge, oldest first.
+
+        Only the entries which fit in the ring are kept, so a large purge costs no more
+        than ``MAX_SNIPES`` insertions.
+        """
+        entries = entries[-MAX_SNIPES:]
+        if not entries:
+            return
+        channels = self.channels.setdefault(guild, {})
+        snipes = channels.get(channel)
+        if snipes is None:
+            snipes = channels[channel] = ChannelSnipes()
+        snipes.deleted.extend(entries)
+        # Entries of a purge share a timeout, so the last deadline covers them all.
+        heapq.heappush(self.expiries, (entries[-1].deadline, guild, channel, "deleted"))
+
+    def get(self, guild: int, channel: int, kind: str = "deleted") -> List[SnipeEntry]:
+        """Unexpired entries of a channel, most recent first."""
+        now = time.monotonic()
+        snipes = self.channels.get(guild, {}).get(channel)
+        if snipes is None:
+            return []
+        return [entry for entry in reversed(getattr(snipes, kind)) if entry.deadline > now]
+
+    def expire(self):
+        now = time.monotonic()
+        expiries = self.expiries
+        while expiries and expiries[0][0] <= now:
+            _, guild, channel, kind = heapq.heappop(expiries)
+            channels = self.channels.get(guild)
+            snipes = channels and channels.get(channel)
+            if not snipes:
+                continue
+            ring = getattr(snipes, kind)
+            # The entry may already have been pushed out of the ring by newer ones, and
+            # entries added before a timeout change can expire out of order.
+            while ring and ring[0].deadline <= now:
+                ring.popleft()
+            if not snipes:
+                del channels[channel]
+                if not channels:
+                    del self.channels[guild]